@@ -10,8 +10,8 @@ Workflow:
 6. Prepare sequences for phylogenetic analysis (MAFFT alignment + ClipKIT trimming)
 """
 
+import argparse
 import os
-import json
 import sys
 
 # Add current directory to path for imports
@@ -24,6 +24,51 @@ from utils import mmseqs2_utils
 from utils import phylogeny_utils
 
 
+def parse_args():
+    """
+    Parse command-line arguments.
+    
+    Returns:
+        argparse.Namespace with:
+        - skip_download (bool): Reprocess the saved UniProt entries instead of
+          querying the UniProt API
+        - save_intermediate (bool): Also save the unique sequences JSON before
+          clustering (it is otherwise written once, with cluster assignments)
+        - threads (int or None): Number of threads for MMseqs2 (None = all CPUs)
+        - output_format (str): How downloaded entries are saved, 'files' (one JSON
+          file per entry) or 'jsonl' (a single entries.jsonl file)
+    """
+    parser = argparse.ArgumentParser(
+        description="Extract and cluster capsid proteins from Orthoretrovirinae Gag proteins in SwissProt."
+    )
+    parser.add_argument(
+        "--skip-download",
+        action="store_true",
+        help="Reprocess the UniProt entries previously saved in "
+             "outputs/orthoretrovirinae_gag_swissprot instead of downloading them again"
+    )
+    parser.add_argument(
+        "--save-intermediate",
+        action="store_true",
+        help="Also save unique_capsid_sequences.json before clustering "
+             "(by default it is written once, after cluster assignments are added)"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="Number of threads for MMseqs2 clustering (default: all available CPUs)"
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["files", "jsonl"],
+        default="files",
+        help="How downloaded UniProt entries are saved: one JSON file per entry "
+             "(default) or a single entries.jsonl file; --skip-download reads either"
+    )
+    return parser.parse_args()
+
+
 def main():
     """
     Main workflow function to extract and process capsid proteins from Orthoretrovirinae Gag proteins.
@@ -38,6 +83,8 @@ def main():
     
     All output files are saved in the 'outputs' directory.
     """
+    args = parse_args()
+    
     # Set up output directories
     output_dir = 'outputs'
     mmseqs2_output_dir = os.path.join(output_dir, 'mmseqs2_outputs')
@@ -56,39 +103,40 @@ def main():
     query = 'reviewed:true AND taxonomy_id:327045 AND gene:gag'
     json_dir = os.path.join(output_dir, 'orthoretrovirinae_gag_swissprot')
     
-    total_downloaded = uniprot_utils.download_uniprot_jsons(
-        query=query,
-        batch_size=500,
-        outdir=json_dir,
-        verbose=False  # Use progress dots instead of per-file messages
-    )
+    if args.skip_download:
+        # Reprocess a previously downloaded snapshot (files are parsed in parallel)
+        print(f"Processing saved JSON files in {json_dir}...", end=" ", flush=True)
+        hits_per_entry = uniprot_utils.extract_capsid_features_from_jsons(json_dir)
+    else:
+        # Entries are processed as each page is downloaded; a copy of every
+        # entry is still saved to json_dir for reproducibility
+        entries = uniprot_utils.stream_uniprot_entries(
+            query=query,
+            batch_size=500,
+            outdir=json_dir,
+            verbose=False,  # Use progress dots instead of per-file messages
+            output_format=args.output_format
+        )
+        hits_per_entry = (uniprot_utils.extract_capsid_features_from_entry(entry) for entry in entries)
     
     all_hits = []
-    json_files = [f for f in os.listdir(json_dir) if f.endswith('.json')]
-    
-    print(f"Processing {len(json_files)} JSON files...", end=" ", flush=True)
-    
-    files_with_hits = 0
-    files_without_hits = 0
-    
-    for json_file in json_files:
-        json_path = os.path.join(json_dir, json_file)
-        
-        with open(json_path, 'r') as f:
-            entry = json.load(f)
-        
-        # Extract capsid features
-        hits = uniprot_utils.extract_capsid_features_from_entry(entry)
-        
+    n_entries = 0
+    entries_with_hits = 0
+    entries_without_hits = 0
+    
+    for hits in hits_per_entry:
+        n_entries += 1
         if hits:
-            files_with_hits += 1
+            entries_with_hits += 1
             all_hits.extend(hits)
         else:
-            files_without_hits += 1
+            entries_without_hits += 1
     
-    print("done.")
-    print(f"  Files with capsid features: {files_with_hits}")
-    print(f"  Files without capsid features: {files_without_hits}")
+    if args.skip_download:
+        print("done.")
+    print(f"  Entries processed: {n_entries}")
+    print(f"  Entries with capsid features: {entries_with_hits}")
+    print(f"  Entries without capsid features: {entries_without_hits}")
     print(f"  Total capsid features found: {len(all_hits)}")
     
     # Save all hits metadata
@@ -107,7 +155,11 @@ def main():
     unique_sequences_file = os.path.join(output_dir, 'unique_capsid_sequences.json')
     unique_fasta = os.path.join(output_dir, 'unique_capsid_sequences.fasta')
     
-    metadata_utils.save_metadata_json(unique_sequences, unique_sequences_file, verbose=False)
+    # The JSON file is written once cluster assignments are known; optionally
+    # keep a pre-clustering copy (useful if clustering fails)
+    if args.save_intermediate:
+        metadata_utils.save_metadata_json(unique_sequences, unique_sequences_file, verbose=False)
+        print(f"Saved pre-clustering snapshot: {unique_sequences_file}")
     fasta_utils.write_fasta_from_metadata_list(
         unique_sequences,
         unique_fasta,
@@ -115,7 +167,7 @@ def main():
         id_key="primaryAccession",
         use_label=True  # Use organism label (e.g., "FIVWO") instead of primaryAccession
     )
-    print(f"Saved: {unique_sequences_file}, {unique_fasta}")
+    print(f"Saved: {unique_fasta}")
     
     # Cluster sequences and add cluster assignments
     print("\n" + "=" * 80)
@@ -133,7 +185,8 @@ def main():
         min_seq_id=0.3,      # 30% minimum sequence identity
         coverage=0.8,         # 80% minimum coverage
         coverage_mode=0,      # Coverage of both query and target sequences
-        remove_tmp_files=True
+        remove_tmp_files=True,
+        threads=args.threads
     )
     
     stats = clustering_results['stats']
@@ -141,9 +194,12 @@ def main():
           f"(size range: {stats['min_cluster_size']}-{stats['max_cluster_size']}, "
           f"mean: {stats['mean_cluster_size']:.1f})")
     
-    # Add cluster assignments and save updated sequences
+    # Add cluster assignments, then save the JSON and TSV once with them included
     mmseqs2_utils.add_cluster_assignments(unique_sequences, clustering_results['output_files']['cluster_tsv'])
     metadata_utils.save_metadata_json(unique_sequences, unique_sequences_file, verbose=False)
+    print(f"Saved: {unique_sequences_file}")
+    tsv_file = os.path.join(output_dir, 'unique_capsid_sequences.tsv')
+    metadata_utils.save_metadata_tsv(unique_sequences, tsv_file, verbose=True)
     
     # Prepare sequences for phylogenetic analysis
     print("\n" + "=" * 80)
@@ -164,15 +220,11 @@ def main():
     else:
         print("Trimmed alignment is ready for IQTREE3 tree inference.")
     
-    # Create TSV file
-    tsv_file = os.path.join(output_dir, 'unique_capsid_sequences.tsv')
-    metadata_utils.save_metadata_tsv(unique_sequences, tsv_file, verbose=True)
-    
     # Summary
     print("\n" + "=" * 80)
     print("Summary")
     print("=" * 80)
-    print(f"Total proteins processed: {len(json_files)}")
+    print(f"Total proteins processed: {n_entries}")
     print(f"Total capsid features found: {len(all_hits)}")
     print(f"Unique capsid sequences: {len(unique_sequences)}")
     print(f"Clusters: {stats['n_clusters']}")
@@ -2,6 +2,7 @@
 Utility modules for bioinformatics data processing.
 
 This package provides utilities for:
+- JSON encoding/decoding (optional orjson fast path)
 - FASTA file operations (reading, writing, format conversion)
 - Metadata aggregation and processing (UniProt entry metadata)
 - MMseqs2 clustering operations (running clustering, parsing results)
@@ -2,6 +2,9 @@
 FASTA file utilities for reading, writing, and processing FASTA files.
 """
 
+# Number of records buffered in memory before each write in write_fasta_from_metadata_list
+_FASTA_WRITE_CHUNK = 10000
+
 
 def _extract_label_from_uniprotkb_id(uniProtkb_id):
     """
@@ -21,12 +24,49 @@ def _extract_label_from_uniprotkb_id(uniProtkb_id):
     if isinstance(uniProtkb_id, list):
         labels = []
         for uid in uniProtkb_id:
-            if '_' in str(uid):
-                labels.append(str(uid).split('_', 1)[1])
-        return ','.join(labels) if labels else ''
-    elif isinstance(uniProtkb_id, str) and '_' in uniProtkb_id:
-        return uniProtkb_id.split('_', 1)[1]
-    return ''
+            _, sep, label = str(uid).partition('_')
+            if sep:
+                labels.append(label)
+        return ','.join(labels)
+    _, _, label = str(uniProtkb_id).partition('_')
+    return label
+
+
+def _resolve_identifier(entry, index, id_key="primaryAccession", use_label=False):
+    """
+    Resolve the FASTA header identifier for one metadata entry.
+    
+    Resolution order when use_label=True: "label" field, label extracted from
+    uniProtkbId, then id_key. Otherwise id_key only. List values are joined
+    with commas; a missing identifier becomes "seq_{index}".
+    
+    Args:
+        entry: Metadata dictionary
+        index: Position of the entry in the metadata list (used for default identifiers)
+        id_key: Key for the identifier (default: "primaryAccession")
+        use_label: If True, prefer the organism label (default: False)
+    
+    Returns:
+        Identifier string
+    """
+    if use_label:
+        # Use label field if available (already handles duplicates)
+        identifier = entry.get("label", "")
+        # Fallback: extract label from uniProtkbId if label field not present
+        if not identifier:
+            uniProtkb_id = entry.get("uniProtkbId", "")
+            identifier = _extract_label_from_uniprotkb_id(uniProtkb_id)
+        # Final fallback to id_key if label extraction failed
+        if not identifier:
+            identifier = entry.get(id_key, f"seq_{index}")
+    else:
+        identifier = entry.get(id_key, f"seq_{index}")
+    
+    if isinstance(identifier, list):
+        # Join multiple accessions with commas
+        identifier = ','.join(str(acc) for acc in identifier) if identifier else f"seq_{index}"
+    
+    return str(identifier)
 
 
 def write_fasta_from_metadata_list(metadata_list, output_file, seq_key="sequence", id_key="primaryAccession", use_label=False):
@@ -61,26 +101,15 @@ def write_fasta_from_metadata_list(metadata_list, output_file, seq_key="sequence
         When use_label=True, the function uses the "label" field from metadata entries,
         which should already be unique (duplicates are handled during metadata aggregation).
     """
-    # Write FASTA file
+    # Build the records in memory and write them in large chunks instead of
+    # issuing one write per record; flush every _FASTA_WRITE_CHUNK records to
+    # cap memory use on very large outputs
+    parts = []
+    append = parts.append
+    n_buffered = 0
     with open(output_file, 'w') as f:
         for i, entry in enumerate(metadata_list):
-            # Get identifier
-            if use_label:
-                # Use label field if available (already handles duplicates)
-                identifier = entry.get("label", "")
-                # Fallback: extract label from uniProtkbId if label field not present
-                if not identifier:
-                    uniProtkb_id = entry.get("uniProtkbId", "")
-                    identifier = _extract_label_from_uniprotkb_id(uniProtkb_id)
-                # Final fallback to id_key if label extraction failed
-                if not identifier:
-                    identifier = entry.get(id_key, f"seq_{i}")
-            else:
-                identifier = entry.get(id_key, f"seq_{i}")
-            
-            if isinstance(identifier, list):
-                # Join multiple accessions with commas
-                identifier = ','.join(str(acc) for acc in identifier) if identifier else f"seq_{i}"
+            identifier = _resolve_identifier(entry, i, id_key, use_label)
             
             # Get sequence (handle both old dict format and new direct format)
             seq_data = entry.get(seq_key, "")
@@ -90,4 +119,16 @@ def write_fasta_from_metadata_list(metadata_list, output_file, seq_key="sequence
                 sequence = str(seq_data) if seq_data else ""
             
             if sequence:
-                f.write(f">{identifier}\n{sequence}\n")
+                append(">")
+                append(identifier)
+                append("\n")
+                append(sequence)
+                append("\n")
+                n_buffered += 1
+                if n_buffered == _FASTA_WRITE_CHUNK:
+                    f.write("".join(parts))
+                    parts.clear()
+                    n_buffered = 0
+        
+        if parts:
+            f.write("".join(parts))
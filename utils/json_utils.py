@@ -0,0 +1,57 @@
+"""
+JSON utilities with an optional fast path through orjson.
+
+orjson is a C/SIMD-accelerated JSON library that parses and serializes
+UniProt entries several times faster than the standard library. It is
+optional: if it is not installed, the standard json module is used.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """
+    Parse a JSON document from bytes or str.
+    
+    Args:
+        data: JSON document as bytes, bytearray, memoryview or str.
+    
+    Returns:
+        The decoded Python object (dicts, lists, strings, numbers, ...).
+    
+    Note:
+        Uses orjson.loads when orjson is installed, json.loads otherwise.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def dumps(obj, indent=False):
+    """
+    Serialize an object to UTF-8 encoded JSON bytes.
+    
+    Args:
+        obj: Object to serialize (dicts with string keys, lists, strings, numbers, ...).
+        indent: If True, pretty-print with 2-space indentation (default: False,
+               compact output).
+    
+    Returns:
+        bytes containing the UTF-8 encoded JSON document.
+    
+    Note:
+        Uses orjson.dumps when orjson is installed, json.dumps otherwise.
+        Non-ASCII characters are written as UTF-8 in both cases, so the output
+        does not depend on which library is available.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
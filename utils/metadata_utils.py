@@ -1,22 +1,107 @@
 """
 Utilities for aggregating and processing metadata from UniProt entries.
 """
-from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+from utils import json_utils
+from utils.fasta_utils import _extract_label_from_uniprotkb_id
 
 
-def _normalize_sequence(seq):
+def _single_or_list(unique_values):
     """
-    Normalize sequence format: handle both dict with "value" key and direct string.
+    Collapse an insertion-ordered collection of unique values for aggregated metadata.
     
     Args:
-        seq: Sequence value (can be dict with "value" key or direct string)
+        unique_values: dict (used as an ordered set) or other sized iterable of
+                      unique values, in first-seen order
     
     Returns:
-        String sequence, or empty string if not found
+        The value itself if there is exactly one, otherwise a list of the values
     """
-    if isinstance(seq, dict):
-        return seq.get("value", "")
-    return str(seq) if seq else ""
+    if len(unique_values) == 1:
+        return next(iter(unique_values))
+    return list(unique_values)
+
+
+def _aggregate_group(sequence, group_hits):
+    """
+    Aggregate the metadata of all hits sharing one sequence into a single entry.
+    
+    Fields with identical values across all hits are stored as single values,
+    fields with different values as lists of unique values (in the order they
+    were first encountered). Hosts are deduplicated by taxonId.
+    
+    Args:
+        sequence: The shared protein sequence (string)
+        group_hits: List of hit dictionaries with this sequence
+    
+    Returns:
+        Aggregated metadata dictionary (without the "label" field)
+    """
+    # Collect the unique values of every field in a single pass over the group.
+    # dicts are used as insertion-ordered sets, so values keep the order in
+    # which they were first encountered.
+    accessions = {}
+    secondary_accessions = {}
+    uniprotkb_ids = {}
+    organisms_scientific = {}
+    organisms_common = {}
+    organisms_taxon = {}
+    descriptions = {}
+    hosts = {}  # taxonId -> first host dict seen with that taxonId
+    for h in group_hits:
+        organism = h["organism"]
+        accessions[h["primaryAccession"]] = None
+        for secondary in h.get("secondaryAccessions", []):
+            secondary_accessions[secondary] = None
+        uniprotkb_ids[h["uniProtkbId"]] = None
+        organisms_scientific[organism["scientificName"]] = None
+        organisms_common[organism["commonName"]] = None
+        organisms_taxon[organism["taxonId"]] = None
+        for host in h.get("organismHosts", []):
+            taxon_id = host.get("taxonId")
+            if taxon_id:
+                hosts.setdefault(taxon_id, host)
+        if "description" in h:
+            descriptions[h["description"]] = None
+    
+    # Aggregate metadata: if all hits have the same value, store as single value;
+    # if values differ, store as list of unique values
+    aggregated = {}
+    
+    # Primary accession: single value if all hits share it, list if different
+    aggregated["primaryAccession"] = _single_or_list(accessions)
+    
+    # Secondary accessions: all unique secondary accessions from all hits
+    aggregated["secondaryAccessions"] = list(secondary_accessions)
+    
+    # UniProtKB ID
+    aggregated["uniProtkbId"] = _single_or_list(uniprotkb_ids)
+    
+    # Organism - aggregate organism fields
+    aggregated["organism"] = {
+        "scientificName": _single_or_list(organisms_scientific),
+        "commonName": _single_or_list(organisms_common),
+        "taxonId": _single_or_list(organisms_taxon),
+        "lineage": group_hits[0]["organism"]["lineage"]  # Lineage should be the same for same taxonomy
+    }
+    
+    # Organism hosts: duplicate hosts were removed based on taxonId (same taxonId = same host)
+    aggregated["organismHosts"] = list(hosts.values())
+    
+    # Description
+    if descriptions:
+        aggregated["description"] = _single_or_list(descriptions)
+    
+    # Sequence
+    aggregated["sequence"] = sequence
+    
+    return aggregated
+
+
+def _indexed_hit_sequence(indexed_hit):
+    """Sort/group key for (index, hit) pairs: the hit's sequence."""
+    return indexed_hit[1]["sequence"]
 
 
 def aggregate_metadata_by_sequence(hits):
@@ -33,10 +118,12 @@ def aggregate_metadata_by_sequence(hits):
     2. Deduplicates sequences that share the same primaryAccession(s):
        - If multiple sequences have the same primaryAccession(s), keeps only the longest sequence
        - This handles cases where the same protein has multiple sequence variants
+       - Done before aggregation, so metadata is only aggregated for the sequences kept
     
     Args:
         hits: List of hit dictionaries, each containing:
-              - "sequence": string or dict with "value" key containing the sequence
+              - "sequence": string containing the sequence (as built by
+                uniprot_utils.extract_capsid_features_from_entry)
               - "primaryAccession": string or list of strings
               - "secondaryAccessions": list of strings
               - "uniProtkbId": string
@@ -60,116 +147,48 @@ def aggregate_metadata_by_sequence(hits):
         - "description": string or list of strings (if multiple descriptions)
         - Other aggregated metadata fields
     """
-    # Group hits by identical sequence (normalize format first)
-    seq_to_hits = defaultdict(list)
-    for hit in hits:
-        seq = _normalize_sequence(hit["sequence"])
-        seq_to_hits[seq].append(hit)
-    
-    # Aggregate metadata for each unique sequence
-    unique_sequences_by_seq = []
-    for sequence, group_hits in seq_to_hits.items():
-        aggregated = {}
+    # Group hits by identical sequence.
+    # Hits are sorted by sequence (keeping their original index) so that each group
+    # can be handled as it comes out of groupby(), without building a dict of every
+    # sequence's hit list first; only the groups that win the deduplication below
+    # keep a list of their hits. Sorting is stable, so the first hit of each group
+    # is also the first one seen in the input.
+    #
+    # Deduplicate sequences that share the same primaryAccession(s) before aggregating:
+    # if multiple sequences have the same accession(s), keep only the longest sequence.
+    # This handles cases where the same protein has multiple sequence variants, and
+    # avoids aggregating metadata for groups that would be thrown away.
+    kept_groups = {}  # normalized_accession_tuple -> [first_seen, group_first_seen, sequence, group_hits]
+    sorted_hits = sorted(enumerate(hits), key=_indexed_hit_sequence)
+    for sequence, group in groupby(sorted_hits, key=_indexed_hit_sequence):
+        group = list(group)
+        group_first_seen = group[0][0]
+        group_hits = [hit for _, hit in group]
         
-        # Aggregate metadata: if all hits have the same value, store as single value;
-        # if values differ, store as list of unique values
+        # Normalize the group's accessions to a sorted tuple of unique, non-empty
+        # accessions so that the same set of accessions always gives the same key
+        acc_tuple = tuple(sorted({str(h["primaryAccession"]) for h in group_hits if h["primaryAccession"]})) or ("",)
         
-        # Primary accession: single value if all hits share it, list if different
-        accessions = [h["primaryAccession"] for h in group_hits]
-        if len(set(accessions)) == 1:
-            aggregated["primaryAccession"] = accessions[0]
-        else:
-            aggregated["primaryAccession"] = list(set(accessions))
-        
-        # Secondary accessions: collect all unique secondary accessions from all hits
-        all_secondary = []
-        for h in group_hits:
-            all_secondary.extend(h.get("secondaryAccessions", []))
-        aggregated["secondaryAccessions"] = list(set(all_secondary)) if all_secondary else []
-        
-        # UniProtKB ID
-        uniprotkb_ids = [h["uniProtkbId"] for h in group_hits]
-        if len(set(uniprotkb_ids)) == 1:
-            aggregated["uniProtkbId"] = uniprotkb_ids[0]
-        else:
-            aggregated["uniProtkbId"] = list(set(uniprotkb_ids))
-        
-        # Organism - aggregate organism fields
-        organisms_scientific = [h["organism"]["scientificName"] for h in group_hits]
-        organisms_common = [h["organism"]["commonName"] for h in group_hits]
-        organisms_taxon = [h["organism"]["taxonId"] for h in group_hits]
-        
-        aggregated["organism"] = {
-            "scientificName": organisms_scientific[0] if len(set(organisms_scientific)) == 1 else list(set(organisms_scientific)),
-            "commonName": organisms_common[0] if len(set(organisms_common)) == 1 else list(set(organisms_common)),
-            "taxonId": organisms_taxon[0] if len(set(organisms_taxon)) == 1 else list(set(organisms_taxon)),
-            "lineage": group_hits[0]["organism"]["lineage"]  # Lineage should be the same for same taxonomy
-        }
-        
-        # Organism hosts: collect all unique hosts, deduplicating by taxonId
-        all_hosts = []
-        for h in group_hits:
-            all_hosts.extend(h.get("organismHosts", []))
-        # Remove duplicate hosts based on taxonId (same taxonId = same host)
-        seen_taxon_ids = set()
-        unique_hosts = []
-        for host in all_hosts:
-            taxon_id = host.get("taxonId")
-            if taxon_id and taxon_id not in seen_taxon_ids:
-                unique_hosts.append(host)
-                seen_taxon_ids.add(taxon_id)
-        aggregated["organismHosts"] = unique_hosts if unique_hosts else []
-        
-        # Description
-        descriptions = [h.get("description", "") for h in group_hits if "description" in h]
-        if descriptions:
-            if len(set(descriptions)) == 1:
-                aggregated["description"] = descriptions[0]
-            else:
-                aggregated["description"] = list(set(descriptions))
-        
-        # Sequence
-        aggregated["sequence"] = sequence
-        
-        unique_sequences_by_seq.append(aggregated)
-    
-    # Second pass: deduplicate sequences that share the same primaryAccession(s)
-    # If multiple sequences have the same accession(s), keep only the longest sequence
-    # This handles cases where the same protein has multiple sequence variants
-    accession_to_entry = {}  # normalized_accession_tuple -> (entry, sequence_length)
-    
-    for entry in unique_sequences_by_seq:
-        # Normalize primaryAccession to a tuple for comparison (handles both single and list formats)
-        acc = entry.get("primaryAccession", "")
-        if isinstance(acc, list):
-            # Sort and deduplicate, filter out empty strings for consistent comparison
-            acc_list = sorted(set(str(a) for a in acc if a))
-            acc_tuple = tuple(acc_list) if acc_list else ("",)
-        else:
-            acc_tuple = (str(acc),) if acc else ("",)
-        
-        # Extract sequence length (normalize format first)
-        seq = _normalize_sequence(entry["sequence"])
-        seq_length = len(seq)
-        
-        # Keep the longest sequence for each unique set of accessions
-        if acc_tuple not in accession_to_entry:
-            accession_to_entry[acc_tuple] = (entry, seq_length)
-        else:
-            existing_entry, existing_length = accession_to_entry[acc_tuple]
-            if seq_length > existing_length:
-                # Replace with longer sequence
-                accession_to_entry[acc_tuple] = (entry, seq_length)
-            elif seq_length == existing_length:
-                # Same length - keep the first one encountered (arbitrary but deterministic)
-                pass
+        # Keep the longest sequence for each unique set of accessions.
+        # Same length - keep the one seen first in the input (arbitrary but deterministic).
+        kept = kept_groups.get(acc_tuple)
+        if kept is None:
+            kept_groups[acc_tuple] = [group_first_seen, group_first_seen, sequence, group_hits]
+            continue
+        # Each set of accessions is output at the position of its first hit in the input
+        kept[0] = min(kept[0], group_first_seen)
+        if len(sequence) > len(kept[2]) or (len(sequence) == len(kept[2]) and group_first_seen < kept[1]):
+            kept[1:] = [group_first_seen, sequence, group_hits]
+    del sorted_hits
     
-    # Return only the entries we kept
-    unique_sequences = [entry for entry, _ in accession_to_entry.values()]
+    # Aggregate metadata for each sequence we kept
+    unique_sequences = [
+        _aggregate_group(sequence, group_hits)
+        for _, _, sequence, group_hits in sorted(kept_groups.values(), key=itemgetter(0))
+    ]
     
     # Add label field to each entry and handle duplicates
     # First, extract base labels and count duplicates
-    from utils.fasta_utils import _extract_label_from_uniprotkb_id
     label_counts = {}
     for entry in unique_sequences:
         uniProtkb_id = entry.get("uniProtkbId", "")
@@ -227,17 +246,98 @@ def save_metadata_json(metadata_list, output_file, verbose=True):
         None (writes directly to file)
     
     Note:
-        Uses json.dump() with indent=2 for human-readable formatting.
+        Uses 2-space indentation for human-readable formatting, serialized with
+        orjson when it is installed (see utils.json_utils).
         All entries are saved in a single JSON array.
     """
-    import json
-    
-    with open(output_file, "w") as f:
-        json.dump(metadata_list, f, indent=2)
+    with open(output_file, "wb") as f:
+        f.write(json_utils.dumps(metadata_list, indent=True))
     if verbose:
         print(f"Saved {len(metadata_list)} entries to {output_file}")
 
 
+def _get_genus(organism):
+    """
+    Extract genus name from organism lineage.
+    
+    Looks for "Orthoretrovirinae" in the lineage list and returns the
+    value immediately following it, which should be the genus name.
+    
+    Args:
+        organism: Organism dictionary containing a 'lineage' list
+    
+    Returns:
+        String genus name if found, empty string otherwise
+    
+    Example:
+        lineage: ["Viruses", "Riboviria", ..., "Orthoretrovirinae", "Lentivirus", ...]
+        Returns: "Lentivirus"
+    """
+    lineage = organism.get('lineage', [])
+    if type(lineage) is list:
+        try:
+            idx = lineage.index('Orthoretrovirinae')
+            if idx + 1 < len(lineage):
+                return lineage[idx + 1]
+        except ValueError:
+            pass
+    return ''
+
+
+def _format_value(value):
+    """
+    Format a value for TSV output by converting to string and handling lists.
+    
+    Args:
+        value: Value to format (can be string, list, None, or other types)
+    
+    Returns:
+        String representation:
+        - Lists: comma-separated string of non-empty values
+        - None: empty string
+        - Other types: string conversion
+    """
+    if type(value) is list:
+        return ','.join(str(v) for v in value if v)
+    elif value is None:
+        return ''
+    else:
+        return str(value)
+
+
+def _build_tsv_row(entry):
+    """
+    Build the TSV row for one metadata entry, in the column order used by save_metadata_tsv.
+    
+    Args:
+        entry: Metadata dictionary (see aggregate_metadata_by_sequence)
+    
+    Returns:
+        List of strings, one per column
+    """
+    # Use label field from entry (already unique, handles duplicates)
+    # Fallback to extracting from uniProtkbId if label field not present
+    label = entry.get('label', '')
+    if not label:
+        label = _extract_label_from_uniprotkb_id(entry.get('uniProtkbId', ''))
+    
+    organism = entry.get('organism', {})
+    
+    return [
+        label,
+        _format_value(entry.get('primaryAccession', '')),
+        _format_value(entry.get('secondaryAccessions', [])),
+        _format_value(entry.get('uniProtkbId', '')),
+        _format_value(organism.get('scientificName', '')),
+        _format_value(organism.get('commonName', '')),
+        _format_value(organism.get('taxonId', '')),
+        _get_genus(organism),
+        entry.get('sequence') or '',
+        _format_value(entry.get('description', '')),
+        _format_value(entry.get('cluster_id', ''))
+    ]
+
+
 def save_metadata_tsv(metadata_list, output_file, verbose=True):
     """
     Save metadata list to a TSV (tab-separated values) file with one row per entry.
@@ -278,131 +378,20 @@ def save_metadata_tsv(metadata_list, output_file, verbose=True):
             print("No data to save")
         return
     
-    def extract_organism_labels(uniProtkb_id):
-        """
-        Extract organism labels from uniProtkbId by taking the part after the underscore.
-        
-        Examples:
-            "GAG_FIVWO" -> "FIVWO"
-            ["GAG_FIVWO", "GAG_FIVCA"] -> "FIVWO,FIVCA"
-            "GAG" -> "" (no underscore)
-        
-        Args:
-            uniProtkb_id: String or list of strings containing UniProtKB IDs
-        
-        Returns:
-            String with comma-separated labels (part after underscore), or empty string if no underscore found
-        """
-        if isinstance(uniProtkb_id, list):
-            labels = []
-            for uid in uniProtkb_id:
-                if '_' in str(uid):
-                    labels.append(str(uid).split('_', 1)[1])
-            return ','.join(labels) if labels else ''
-        elif isinstance(uniProtkb_id, str) and '_' in uniProtkb_id:
-            return uniProtkb_id.split('_', 1)[1]
-        return ''
-    
-    def get_genus(entry):
-        """
-        Extract genus name from organism lineage.
-        
-        Looks for "Orthoretrovirinae" in the lineage list and returns the
-        value immediately following it, which should be the genus name.
-        
-        Args:
-            entry: Metadata dictionary containing 'organism' key with 'lineage' list
-        
-        Returns:
-            String genus name if found, empty string otherwise
-        
-        Example:
-            lineage: ["Viruses", "Riboviria", ..., "Orthoretrovirinae", "Lentivirus", ...]
-            Returns: "Lentivirus"
-        """
-        lineage = entry.get('organism', {}).get('lineage', [])
-        if isinstance(lineage, list):
-            try:
-                idx = lineage.index('Orthoretrovirinae')
-                if idx + 1 < len(lineage):
-                    return lineage[idx + 1]
-            except ValueError:
-                pass
-        return ''
-    
-    def format_value(value):
-        """
-        Format a value for TSV output by converting to string and handling lists.
-        
-        Args:
-            value: Value to format (can be string, list, None, or other types)
-        
-        Returns:
-            String representation:
-            - Lists: comma-separated string of non-empty values
-            - None: empty string
-            - Other types: string conversion
-        """
-        if isinstance(value, list):
-            return ','.join(str(v) for v in value if v)
-        elif value is None:
-            return ''
-        else:
-            return str(value)
-    
     # Define column order
     columns = ['label', 'primaryAccession', 'secondaryAccessions', 'uniProtkbId',
                'scientificName', 'commonName', 'taxonId', 'genus', 
                'sequence', 'description', 'cluster_id']
     
+    # Build all rows first, then write them with a single writerows() call
+    rows = [_build_tsv_row(entry) for entry in metadata_list]
+    
     # Write TSV file
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+    # Large write buffer: rows are flushed to disk in few, big writes
+    with open(output_file, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
         writer = csv.writer(f, delimiter='\t')
-        
-        # Write header
         writer.writerow(columns)
-        
-        # Write data rows
-        for entry in metadata_list:
-            row = []
-            
-            # Use label field from entry (already unique, handles duplicates)
-            # Fallback to extracting from uniProtkbId if label field not present
-            label = entry.get('label', '')
-            if not label:
-                uniProtkb_id = entry.get('uniProtkbId', '')
-                label = extract_organism_labels(uniProtkb_id)
-            row.append(label)
-            
-            # Primary accession
-            row.append(format_value(entry.get('primaryAccession', '')))
-            
-            # Secondary accessions
-            row.append(format_value(entry.get('secondaryAccessions', [])))
-            
-            # UniProtKB ID
-            row.append(format_value(entry.get('uniProtkbId', '')))
-            
-            # Organism fields
-            organism = entry.get('organism', {})
-            row.append(format_value(organism.get('scientificName', '')))
-            row.append(format_value(organism.get('commonName', '')))
-            row.append(format_value(organism.get('taxonId', '')))
-            
-            # Genus
-            row.append(get_genus(entry))
-            
-            # Sequence
-            seq = _normalize_sequence(entry.get('sequence', ''))
-            row.append(str(seq) if seq else '')
-            
-            # Description
-            row.append(format_value(entry.get('description', '')))
-            
-            # Cluster ID
-            row.append(format_value(entry.get('cluster_id', '')))
-            
-            writer.writerow(row)
+        writer.writerows(rows)
     
     if verbose:
         print(f"Saved {len(metadata_list)} entries to {output_file}")
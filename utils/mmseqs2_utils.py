@@ -2,10 +2,62 @@
 Utilities for running MMseqs2 clustering and parsing results.
 """
 import os
+import mmap
 import shutil
 import subprocess
-import pandas as pd
+from collections import Counter, deque
+from functools import lru_cache
+from typing import TYPE_CHECKING
+import numpy as np
 from utils.fasta_utils import _extract_label_from_uniprotkb_id
+from utils.phylogeny_utils import _available_cpu_count
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Number of trailing MMseqs2 output lines kept to report when the command fails
+_MMSEQS_OUTPUT_TAIL = 20
+
+# SIMD-specific MMseqs2 builds (as shipped in the static release archives),
+# fastest first, with the CPU flag each one needs
+_MMSEQS_SIMD_BINARIES = [
+    ("avx2", "mmseqs_avx2"),
+    ("sse4_1", "mmseqs_sse41"),
+    ("sse2", "mmseqs_sse2"),
+]
+
+
+def _resolve_mmseqs_binary() -> str:
+    """
+    Pick the fastest MMseqs2 executable this CPU can run.
+    
+    The static MMseqs2 releases ship separate AVX2/SSE4.1/SSE2 builds. If any of them
+    is in PATH, the fastest one supported by the CPU (according to /proc/cpuinfo) is
+    used. Otherwise, or if the CPU flags cannot be read (e.g. not on Linux), the
+    plain 'mmseqs' executable is used, which for conda installs is already a wrapper
+    that makes the same choice.
+    
+    Returns:
+        Name or path of the MMseqs2 executable to run.
+    """
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    cpu_flags = set(line.split(":", 1)[1].split())
+                    break
+            else:
+                return "mmseqs"
+    except OSError:
+        return "mmseqs"
+    
+    for flag, binary in _MMSEQS_SIMD_BINARIES:
+        if flag in cpu_flags:
+            path = shutil.which(binary)
+            if path:
+                return path
+    return "mmseqs"
 
 
 def run_mmseqs_clustering(
@@ -15,14 +67,18 @@ def run_mmseqs_clustering(
     min_seq_id: float = 0.3,
     coverage: float = 0.8,
     coverage_mode: int = 0,
-    remove_tmp_files: bool = True
+    remove_tmp_files: bool = True,
+    threads: int = None,
+    verbose: bool = False,
+    mmseqs_binary: str = None
 ) -> dict:
     """
     Run MMseqs2 easy-cluster on a protein dataset to group similar sequences.
     
     This function executes MMseqs2's easy-cluster command, which performs sequence
-    clustering based on sequence identity and coverage thresholds. It automatically
-    handles pagination and temporary file management.
+    clustering based on sequence identity and coverage thresholds. easy-cluster runs
+    createdb, cluster, createtsv and the FASTA export as a single workflow, so no
+    intermediate databases have to be built or cleaned up by separate calls.
     
     Args:
         input_fasta: Path to input FASTA file containing protein sequences to cluster.
@@ -44,6 +100,13 @@ def run_mmseqs_clustering(
                       - 2: Coverage of query sequence only
         remove_tmp_files: If True, removes temporary MMseqs2 files after clustering
                          completes. If False, keeps them for debugging. Default: True.
+        threads: Number of CPU threads MMseqs2 may use. Default: None (use all
+                CPUs this process may run on, according to its CPU affinity, so
+                container and batch job limits are respected).
+        verbose: If True, MMseqs2's progress output is printed line by line as it
+                runs. If False, it is not shown. Default: False.
+        mmseqs_binary: MMseqs2 executable to run. Default: None (use the fastest
+                      SIMD build available, see _resolve_mmseqs_binary()).
     
     Returns:
         Dictionary with the following keys:
@@ -55,119 +118,282 @@ def run_mmseqs_clustering(
                       - 'min_cluster_size': size of smallest cluster
                       - 'max_cluster_size': size of largest cluster
                       - 'mean_cluster_size': average cluster size
-                      - 'median_cluster_size': median cluster size
+                      - 'median_cluster_size': median cluster size (see parse_cluster_tsv)
             - 'cluster_sizes': list of cluster sizes (one value per cluster)
     
     Raises:
         FileNotFoundError: If expected output files are not created after clustering
         subprocess.CalledProcessError: If MMseqs2 command fails
-        Exception: For other unexpected errors during clustering
     
     Note:
-        Requires MMseqs2 to be installed and available in PATH as 'mmseqs'.
+        Requires MMseqs2 to be installed and available in PATH as 'mmseqs' (or as
+        one of the SIMD-specific builds, or passed as mmseqs_binary).
+        OpenMP threads are pinned to cores (OMP_PROC_BIND=close, OMP_PLACES=cores)
+        unless those variables are already set in the environment.
         The function prints progress messages and error details if clustering fails.
+        MMseqs2's (large) progress output is streamed line by line rather than buffered:
+        only the last _MMSEQS_OUTPUT_TAIL lines are kept, to report if the command fails.
     """
     # Create temporary directory if it doesn't exist
     os.makedirs(tmp_dir, exist_ok=True)
     
     # Construct the MMseqs2 command
     cmd = [
-        "mmseqs",
+        mmseqs_binary or _resolve_mmseqs_binary(),
         "easy-cluster",
         input_fasta,
         output_prefix,
         tmp_dir,
         "--min-seq-id", str(min_seq_id),
         "-c", str(coverage),
-        "--cov-mode", str(coverage_mode)
+        "--cov-mode", str(coverage_mode),
+        "--threads", str(threads or _available_cpu_count())
     ]
     
-    if remove_tmp_files:
-        cmd.append("--remove-tmp-files")
+    # Pass an explicit value so MMseqs2 cleans up (or keeps) its own temporary files
+    cmd += ["--remove-tmp-files", "1" if remove_tmp_files else "0"]
+    
+    # Keep OpenMP threads on their cores instead of letting them migrate
+    env = dict(os.environ)
+    env.setdefault("OMP_PROC_BIND", "close")
+    env.setdefault("OMP_PLACES", "cores")
+    
+    # Run the command
+    print(f"Running MMseqs2 clustering with min-seq-id={min_seq_id}, coverage={coverage}, cov-mode={coverage_mode}...")
+    # Drain stdout and stderr together as MMseqs2 writes them, so the pipe
+    # never fills up, keeping only the tail of the output for error messages
+    # The output is read as bytes and only decoded when it is printed, so the
+    # progress output of a successful quiet run is never decoded at all
+    output_tail = deque(maxlen=_MMSEQS_OUTPUT_TAIL)
+    with subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        env=env
+    ) as process:
+        for line in process.stdout:
+            if verbose:
+                print(line.decode('utf-8', errors='replace'), end='')
+            output_tail.append(line)
+    if process.returncode:
+        # MMseqs2 reports the cause of a failure at the end of its output
+        output = b''.join(output_tail).decode('utf-8', errors='replace')
+        print(f"Error running MMseqs2 (exit status {process.returncode}). Last lines of output:")
+        print(output, end='')
+        raise subprocess.CalledProcessError(process.returncode, cmd, output=output)
+    
+    # Get output file paths
+    output_files = {
+        'cluster_tsv': f"{output_prefix}_cluster.tsv",
+        'rep_seq': f"{output_prefix}_rep_seq.fasta",
+        'all_seqs': f"{output_prefix}_all_seqs.fasta"
+    }
     
+    # Verify output files exist.
+    # They all live in the output prefix's directory, so list it once instead of
+    # stat-ing each file (fewer metadata round-trips on network filesystems)
     try:
-        # Run the command
-        print(f"Running MMseqs2 clustering with min-seq-id={min_seq_id}, coverage={coverage}, cov-mode={coverage_mode}...")
-        subprocess.run(
-            cmd,
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        
-        # Get output file paths
-        output_files = {
-            'cluster_tsv': f"{output_prefix}_cluster.tsv",
-            'rep_seq': f"{output_prefix}_rep_seq.fasta",
-            'all_seqs': f"{output_prefix}_all_seqs.fasta"
-        }
-        
-        # Verify output files exist
-        for file_type, file_path in output_files.items():
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"Expected output file {file_path} not found")
-        
-        # Parse cluster assignments and calculate statistics
-        n_clusters, cluster_sizes, stats = parse_cluster_tsv(output_files['cluster_tsv'])
-        
-        # Explicitly remove temporary directory if requested
-        # (MMseqs2 --remove-tmp-files may not remove the directory itself)
-        if remove_tmp_files and os.path.exists(tmp_dir):
-            try:
-                shutil.rmtree(tmp_dir)
-            except Exception as e:
-                # Don't fail if cleanup fails, just warn
-                print(f"Warning: Could not remove temporary directory {tmp_dir}: {e}")
-        
-        return {
-            'output_files': output_files,
-            'stats': stats,
-            'cluster_sizes': cluster_sizes
-        }
-        
-    except subprocess.CalledProcessError as e:
-        print(f"Error running MMseqs2: {e}")
-        if e.stderr:
-            print(f"Error output: {e.stderr[:500]}")
-        raise
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        raise
+        with os.scandir(os.path.dirname(output_prefix) or '.') as it:
+            existing_files = {entry.name for entry in it}
+    except FileNotFoundError:
+        existing_files = set()
+    for file_type, file_path in output_files.items():
+        if os.path.basename(file_path) not in existing_files:
+            raise FileNotFoundError(f"Expected output file {file_path} not found")
+    
+    # Parse cluster assignments and calculate statistics
+    n_clusters, cluster_sizes, stats = parse_cluster_tsv(output_files['cluster_tsv'])
+    
+    # Explicitly remove temporary directory if requested
+    # (MMseqs2 --remove-tmp-files may not remove the directory itself)
+    if remove_tmp_files and os.path.exists(tmp_dir):
+        try:
+            shutil.rmtree(tmp_dir)
+        except Exception as e:
+            # Don't fail if cleanup fails, just warn
+            print(f"Warning: Could not remove temporary directory {tmp_dir}: {e}")
+    
+    return {
+        'output_files': output_files,
+        'stats': stats,
+        'cluster_sizes': cluster_sizes
+    }
+
+
+# Cluster TSVs up to this size are parsed once into cached membership lists shared
+# by parse_cluster_tsv, get_cluster_dataframe and add_cluster_assignments;
+# larger ones are never cached: parse_cluster_tsv only counts them line by line,
+# and the other two parse them again on every call
+_CLUSTER_TSV_CACHE_MAX_BYTES = 64 << 20
 
 
-def _parse_cluster_members(cluster_tsv: str):
+def _split_cluster_line(line: bytes):
     """
-    Parse MMseqs2 cluster TSV file and return cluster membership dictionary.
+    Split one raw line of an MMseqs2 cluster TSV file into (rep_id, member_id) bytes.
     
-    Helper function that extracts the core parsing logic shared by parse_cluster_tsv
-    and get_cluster_dataframe.
+    Returns None for lines without a member column or with an empty member ID.
+    Columns after the second are ignored.
+    """
+    line = line.rstrip(b'\r\n')
+    tab = line.find(b'\t')
+    if tab < 0:
+        return None
+    end = line.find(b'\t', tab + 1)
+    member_id = line[tab + 1:end] if end >= 0 else line[tab + 1:]
+    if not member_id:
+        return None
+    return line[:tab], member_id
+
+
+def _load_cluster_members(cluster_tsv: str) -> tuple:
+    """
+    Return the membership of a cluster TSV file, from the cache if possible.
+    
+    The file is memory-mapped and parsed as bytes in pure Python, so pandas is not
+    needed here. Files up to _CLUSTER_TSV_CACHE_MAX_BYTES are cached, keyed on their
+    modification time and size, so reading the same TSV again (e.g. in
+    add_cluster_assignments after run_mmseqs_clustering) does not parse it again,
+    while a rewritten file is. Larger files are parsed on every call and not kept.
     
     Args:
         cluster_tsv: Path to cluster TSV file created by MMseqs2 easy-cluster command.
     
     Returns:
-        Dictionary mapping representative_id -> list of member_ids (including representative)
+        Tuple of (representative_id, tuple of member_ids) pairs, in the order
+        representatives first appear in the file; shared between callers when cached.
+    """
+    st = os.stat(cluster_tsv)
+    parse = _parse_cluster_members_cached
+    if st.st_size > _CLUSTER_TSV_CACHE_MAX_BYTES:
+        # Too large to keep around: parse without storing the result in the cache
+        parse = _parse_cluster_members_cached.__wrapped__
+    return parse(os.path.abspath(cluster_tsv), st.st_mtime_ns, st.st_size)
+
+
+@lru_cache(maxsize=4)
+def _parse_cluster_members_cached(cluster_tsv: str, mtime_ns: int, size: int) -> tuple:
+    """
+    Parse a cluster TSV for _load_cluster_members; mtime_ns and size are cache keys only.
+    
+    Returns an immutable tuple of (rep_id, tuple of member_ids) pairs, in the order
+    representatives first appear in the file, so that it can be shared between callers.
+    """
+    # Parse the raw bytes, so that each ID is decoded only once, when the membership
+    # lists are built, instead of decoding and splitting every line as text
+    if size == 0:
+        return ()
+    
+    members_by_rep = {}  # rep_id bytes -> dict of member_id bytes (used as an ordered set)
+    with open(cluster_tsv, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line in iter(mm.readline, b''):
+            pair = _split_cluster_line(line)
+            if pair is None:
+                continue
+            rep_id, member_id = pair
+            
+            members = members_by_rep.get(rep_id)
+            if members is None:
+                members_by_rep[rep_id] = {member_id: None}
+            else:
+                # Duplicate (rep_id, member_id) pairs are only kept once
+                members[member_id] = None
+    
+    return tuple(
+        (rep_id.decode('utf-8'), tuple(member_id.decode('utf-8') for member_id in members))
+        for rep_id, members in members_by_rep.items()
+    )
+
+
+def clear_cache():
     """
-    cluster_members = {}
+    Drop the cached cluster membership.
     
-    with open(cluster_tsv, 'r') as f:
+    Parsed cluster TSVs are cached (see _load_cluster_members) and re-read
+    automatically when a file's modification time or size changes. Call this to
+    release the memory they use, or to force a re-read of a file rewritten within
+    the timestamp resolution of the filesystem.
+    """
+    _parse_cluster_members_cached.cache_clear()
+
+
+def _count_unique_members(cluster_tsv: str) -> dict:
+    """
+    Count the unique members of each cluster, wherever its rows are in the file.
+    
+    Fallback of _cluster_size_counter for files whose cluster rows are not
+    contiguous. The member sets are only held while counting and, unlike
+    _load_cluster_members, nothing is cached.
+    
+    Args:
+        cluster_tsv: Path to cluster TSV file created by MMseqs2 easy-cluster command.
+    
+    Returns:
+        Dictionary mapping representative_id -> number of unique members (including
+        the representative), in the order representatives first appear in the file.
+    """
+    members_by_rep = {}  # rep_id bytes -> set of member_id bytes
+    with open(cluster_tsv, 'rb') as f:
         for line in f:
-            line = line.strip()
-            if not line:
+            pair = _split_cluster_line(line)
+            if pair is None:
                 continue
-            parts = line.split('\t')
-            if len(parts) >= 2:
-                rep_id = parts[0]      # Representative sequence ID for this cluster
-                member_id = parts[1]    # Member sequence ID (same as rep_id for singletons)
-                
-                if rep_id not in cluster_members:
-                    cluster_members[rep_id] = []
-                
-                # Add member if not already present (avoid duplicate entries)
-                if member_id not in cluster_members[rep_id]:
-                    cluster_members[rep_id].append(member_id)
+            rep_id, member_id = pair
+            
+            members = members_by_rep.get(rep_id)
+            if members is None:
+                members_by_rep[rep_id] = {member_id}
+            else:
+                members.add(member_id)
     
-    return cluster_members
+    return {rep_id.decode('utf-8'): len(members) for rep_id, members in members_by_rep.items()}
+
+
+def _cluster_size_counter(cluster_tsv: str) -> dict:
+    """
+    Count the unique members of each cluster in an MMseqs2 cluster TSV file.
+    
+    Unlike _load_cluster_members, no member lists are built: the file is read line
+    by line as bytes and only the members of the current cluster are held in memory,
+    so memory use is bounded by the number of clusters rather than by the size of
+    the file.
+    
+    Args:
+        cluster_tsv: Path to cluster TSV file created by MMseqs2 easy-cluster command.
+    
+    Returns:
+        Dictionary mapping representative_id -> number of unique members (including
+        the representative), in the order representatives first appear in the file.
+    
+    Note:
+        MMseqs2 writes all rows of a cluster together, so duplicate rows are only
+        looked for within a run of rows with the same representative. If a
+        representative shows up again after another one, the file is not in that
+        layout and the file is scanned again, counting each cluster's unique members
+        (see _count_unique_members). That scan is not cached, as files this size are
+        kept out of the membership cache (see _load_cluster_members).
+    """
+    cluster_sizes = Counter()  # rep_id bytes -> number of unique members
+    current_rep = None
+    current_members = set()
+    with open(cluster_tsv, 'rb') as f:
+        for line in f:
+            pair = _split_cluster_line(line)
+            if pair is None:
+                continue
+            rep_id, member_id = pair
+            
+            if rep_id != current_rep:
+                if rep_id in cluster_sizes:
+                    # Cluster rows are not contiguous: count exactly instead
+                    return _count_unique_members(cluster_tsv)
+                current_rep = rep_id
+                current_members = set()
+            
+            if member_id not in current_members:
+                current_members.add(member_id)
+                cluster_sizes[rep_id] += 1
+    
+    return {rep_id.decode('utf-8'): size for rep_id, size in cluster_sizes.items()}
 
 
 def parse_cluster_tsv(cluster_tsv: str):
@@ -195,30 +421,41 @@ def parse_cluster_tsv(cluster_tsv: str):
                            - 'min_cluster_size': minimum cluster size
                            - 'max_cluster_size': maximum cluster size
                            - 'mean_cluster_size': average cluster size
-                           - 'median_cluster_size': median cluster size
+                           - 'median_cluster_size': median cluster size (mean of
+                             the two middle sizes when the number of clusters is even)
     
     Note:
         Empty lines are skipped. Duplicate entries (same rep_id, member_id pair)
         are ignored (only counted once per cluster).
+        The file is parsed as bytes in pure Python, so pandas is not imported, and
+        the statistics are computed with NumPy. Files larger than
+        _CLUSTER_TSV_CACHE_MAX_BYTES are counted without building the membership
+        lists (see _cluster_size_counter).
     """
-    cluster_members = _parse_cluster_members(cluster_tsv)
+    if os.path.getsize(cluster_tsv) <= _CLUSTER_TSV_CACHE_MAX_BYTES:
+        # Parse (and cache) the membership: it is reused by add_cluster_assignments
+        clusters = _load_cluster_members(cluster_tsv)
+        size_values = [len(members) for _, members in clusters]
+    else:
+        size_values = list(_cluster_size_counter(cluster_tsv).values())
+    sizes = np.array(size_values, dtype=np.int64)
     
-    n_clusters = len(cluster_members)
-    cluster_sizes = [len(members) for members in cluster_members.values()]
+    n_clusters = len(sizes)
+    has_clusters = n_clusters > 0
     
     stats = {
         "n_clusters": n_clusters,
-        "total_sequences": sum(cluster_sizes),
-        "min_cluster_size": min(cluster_sizes) if cluster_sizes else 0,
-        "max_cluster_size": max(cluster_sizes) if cluster_sizes else 0,
-        "mean_cluster_size": sum(cluster_sizes) / len(cluster_sizes) if cluster_sizes else 0,
-        "median_cluster_size": sorted(cluster_sizes)[len(cluster_sizes) // 2] if cluster_sizes else 0
+        "total_sequences": int(sizes.sum()),
+        "min_cluster_size": int(sizes.min()) if has_clusters else 0,
+        "max_cluster_size": int(sizes.max()) if has_clusters else 0,
+        "mean_cluster_size": float(sizes.mean()) if has_clusters else 0,
+        "median_cluster_size": float(np.median(sizes)) if has_clusters else 0
     }
     
-    return n_clusters, cluster_sizes, stats
+    return n_clusters, sizes.tolist(), stats
 
 
-def get_cluster_dataframe(cluster_tsv: str) -> pd.DataFrame:
+def get_cluster_dataframe(cluster_tsv: str) -> "pd.DataFrame":
     """
     Parse MMseqs2 cluster TSV file into a pandas DataFrame for easier manipulation.
     
@@ -240,23 +477,93 @@ def get_cluster_dataframe(cluster_tsv: str) -> pd.DataFrame:
     
     Note:
         Empty lines are skipped. Duplicate entries are ignored.
-        Requires pandas to be installed.
+        Requires pandas to be installed. pandas is imported here rather than at
+        module level, so the rest of the pipeline does not pay for importing it.
         Internally reuses shared parsing logic to avoid code duplication.
+        The frame is built column-wise from the parsed membership, without per-row objects.
     """
+    import pandas as pd
+    
     # Reuse shared parsing logic
-    cluster_members = _parse_cluster_members(cluster_tsv)
+    clusters = _load_cluster_members(cluster_tsv)
+    
+    # Clusters in order of first appearance, members in file order within each cluster
+    sizes = np.array([len(members) for _, members in clusters], dtype=np.int64)
+    rep_ids = np.array([rep_id for rep_id, _ in clusters], dtype=object)
+    
+    return pd.DataFrame({
+        'representative_id': np.repeat(rep_ids, sizes),
+        'member_id': np.array(
+            [member_id for _, members in clusters for member_id in members], dtype=object
+        ),
+        'cluster_size': np.repeat(sizes, sizes)
+    })
+
+
+def _candidate_lookup_keys(lookup_key):
+    """
+    Yield the identifiers to try for an entry, in order of preference.
     
-    # Build DataFrame
-    rows = []
-    for rep_id, members in cluster_members.items():
-        for member_id in members:
-            rows.append({
-                'representative_id': rep_id,
-                'member_id': member_id,
-                'cluster_size': len(members)
-            })
+    Args:
+        lookup_key: Identifier of the entry (label, or comma-separated labels/accessions).
+    
+    Yields:
+        1. The identifier itself
+        2. If it contains commas: its parts sorted and re-joined
+        3. If it contains commas: each (stripped) part individually
+    
+    Note:
+        Keys are generated lazily, so the fallbacks are only built for entries
+        whose identifier does not match directly.
+    """
+    yield lookup_key
+    if ',' in lookup_key:
+        parts = lookup_key.split(',')
+        yield ','.join(sorted(parts))
+        yield from map(str.strip, parts)
+
+
+def _lookup_cluster_id(sequence_to_cluster_id, lookup_key):
+    """
+    Find the cluster ID for a FASTA identifier, trying the fallbacks in order.
+    
+    Args:
+        sequence_to_cluster_id: Dictionary mapping sequence identifiers to cluster IDs.
+        lookup_key: Identifier of the entry (label, or comma-separated labels/accessions).
     
-    return pd.DataFrame(rows)
+    Returns:
+        The cluster ID of the first candidate key (see _candidate_lookup_keys) found
+        in sequence_to_cluster_id, or None if there is none.
+    """
+    return next(
+        (sequence_to_cluster_id[key] for key in _candidate_lookup_keys(lookup_key) if key in sequence_to_cluster_id),
+        None
+    )
+
+
+def _fallback_lookup_key(entry):
+    """
+    Build the identifier of a metadata entry that has no 'label' field.
+    
+    Args:
+        entry: Metadata dictionary.
+    
+    Returns:
+        The label extracted from 'uniProtkbId' if possible, otherwise the
+        'primaryAccession' value (comma-joined if it is a list), or "" if neither is set.
+    """
+    # Fallback: extract label from uniProtkbId if label field not present
+    lookup_key = _extract_label_from_uniprotkb_id(entry.get('uniProtkbId', ''))
+    
+    # Final fallback to primaryAccession if label extraction failed
+    if not lookup_key:
+        acc = entry.get('primaryAccession', '')
+        if isinstance(acc, list):
+            lookup_key = ','.join(str(a) for a in acc if a)
+        else:
+            lookup_key = str(acc) if acc else ""
+    
+    return lookup_key
 
 
 def add_cluster_assignments(metadata_list, cluster_tsv):
@@ -296,74 +603,32 @@ def add_cluster_assignments(metadata_list, cluster_tsv):
         and that the 'label' field in metadata entries matches the FASTA headers.
     """
     # Load cluster assignments
-    cluster_df = get_cluster_dataframe(cluster_tsv)
+    clusters = _load_cluster_members(cluster_tsv)
     
     # Build mapping from sequence identifier (as it appears in FASTA) to cluster_id
     # Cluster IDs are assigned sequentially (1, 2, 3, ...) based on representative order
+    # All members of a cluster get the same cluster_id as their representative
     sequence_to_cluster_id = {}
-    representative_to_cluster_num = {}
-    
-    for idx, row in cluster_df.iterrows():
-        rep_id = row['representative_id']
-        member_id = row['member_id']
-        
-        # Assign sequential cluster number to each unique representative (first time we see it)
-        if rep_id not in representative_to_cluster_num:
-            representative_to_cluster_num[rep_id] = len(representative_to_cluster_num) + 1
-        
-        # All members of a cluster get the same cluster_id as their representative
-        cluster_id = representative_to_cluster_num[rep_id]
-        sequence_to_cluster_id[member_id] = cluster_id
+    for cluster_id, (_, members) in enumerate(clusters, start=1):
+        for member_id in members:
+            sequence_to_cluster_id[member_id] = cluster_id
     
     # Add cluster_id to each metadata entry by matching sequence identifiers
     # FASTA file uses the "label" field from metadata entries, which is already unique
+    get_cluster_id = sequence_to_cluster_id.get
     for entry in metadata_list:
-        # Use label field if available (already handles duplicates)
+        # Use label field if available (already handles duplicates); for entries
+        # written to the FASTA file this matches directly, so the fallbacks below
+        # (and their per-entry type checks) are skipped
         lookup_key = entry.get('label', '')
+        cluster_id = get_cluster_id(lookup_key) if lookup_key else None
         
-        # Fallback: extract label from uniProtkbId if label field not present
-        if not lookup_key:
-            uniProtkb_id = entry.get('uniProtkbId', '')
-            lookup_key = _extract_label_from_uniprotkb_id(uniProtkb_id)
-        
-        # Final fallback to primaryAccession if label extraction failed
-        if not lookup_key:
-            acc = entry.get('primaryAccession', '')
-            if isinstance(acc, list):
-                lookup_key = ','.join(str(a) for a in acc if a)
-            else:
-                lookup_key = str(acc) if acc else ""
-        
-        # Try exact match
-        cluster_id = sequence_to_cluster_id.get(lookup_key)
+        if cluster_id is None:
+            if not lookup_key:
+                lookup_key = _fallback_lookup_key(entry)
+            cluster_id = _lookup_cluster_id(sequence_to_cluster_id, lookup_key)
         
-        if cluster_id is not None:
-            entry['cluster_id'] = cluster_id
-        else:
-            # Strategy 2: If not found and lookup_key contains commas, try sorted version
-            if ',' in lookup_key:
-                sorted_key = ','.join(sorted(lookup_key.split(',')))
-                cluster_id = sequence_to_cluster_id.get(sorted_key)
-                if cluster_id is not None:
-                    entry['cluster_id'] = cluster_id
-                else:
-                    # Strategy 3: Try individual labels/accessions (last resort)
-                    parts = lookup_key.split(',')
-                    if len(parts) > 0:
-                        # Try each part individually
-                        found = False
-                        for part in parts:
-                            cluster_id = sequence_to_cluster_id.get(part.strip())
-                            if cluster_id is not None:
-                                entry['cluster_id'] = cluster_id
-                                found = True
-                                break
-                        if not found:
-                            entry['cluster_id'] = None
-                    else:
-                        entry['cluster_id'] = None
-            else:
-                entry['cluster_id'] = None
+        entry['cluster_id'] = cluster_id
     
     return sequence_to_cluster_id
 
@@ -4,9 +4,208 @@ Utilities for phylogenetic analysis preparation: multiple sequence alignment and
 import os
 import shutil
 import subprocess
+import tempfile
+from functools import partial
 from typing import Optional
 
 
+# Log file layouts (filled with % formatting)
+_LOG_RULE = "=" * 80
+
+# Written after a successful run: title, run details, then the captured output
+_LOG_TEMPLATE = (
+    _LOG_RULE + "\n%(title)s\n" + _LOG_RULE + "\n"
+    "%(details)s"
+    "\n" + _LOG_RULE + "\nSTDOUT:\n" + _LOG_RULE + "\n%(stdout)s"
+    "\n" + _LOG_RULE + "\nSTDERR:\n" + _LOG_RULE + "\n%(stderr)s"
+)
+
+# Written when the command fails
+_ERROR_LOG_TEMPLATE = (
+    _LOG_RULE + "\n%(title)s - ERROR\n" + _LOG_RULE + "\n"
+    "Command: %(command)s\n"
+    "Return code: %(returncode)s\n"
+    "STDOUT:\n%(stdout)s\n"
+    "STDERR:\n%(stderr)s\n"
+)
+
+
+def _write_log(log_file: str, title: str, details: list, stdout: str, stderr: str):
+    """
+    Write the log file of a successful run.
+    
+    Args:
+        log_file: Path to the log file
+        title: Log title (e.g. "MAFFT Alignment Log")
+        details: List of (label, value) pairs describing the run (command, input, ...)
+        stdout: Captured standard output of the command
+        stderr: Captured standard error of the command
+    """
+    with open(log_file, 'w') as f:
+        f.write(_LOG_TEMPLATE % {
+            "title": title,
+            "details": "".join("%s: %s\n" % item for item in details),
+            "stdout": stdout or "",
+            "stderr": stderr or "",
+        })
+
+
+def _write_error_log(log_file: str, title: str, cmd: list, returncode: int, stdout: str, stderr: str):
+    """
+    Write the log file of a failed run.
+    
+    Args:
+        log_file: Path to the log file
+        title: Log title (" - ERROR" is appended)
+        cmd: Command that was run
+        returncode: Exit status of the command
+        stdout: Captured standard output of the command
+        stderr: Captured standard error of the command
+    """
+    with open(log_file, 'w') as f:
+        f.write(_ERROR_LOG_TEMPLATE % {
+            "title": title,
+            "command": ' '.join(cmd),
+            "returncode": returncode,
+            "stdout": stdout,
+            "stderr": stderr,
+        })
+
+
+def _read_captured(f) -> str:
+    """Read back command output captured in a temporary file, as text."""
+    f.seek(0)
+    return f.read().decode('utf-8', errors='replace')
+
+
+def _run_to_files(cmd: list, stdout_file=None, keep_output: bool = False) -> tuple:
+    """
+    Run a command with its output going to files instead of pipes.
+    
+    The child writes straight to disk, so Python never has to drain pipes while it
+    runs (no blocking on a full pipe, no buffering of large outputs in memory).
+    Captured output is only read back when it is needed.
+    
+    Args:
+        cmd: Command to run
+        stdout_file: Open binary file that receives stdout (e.g. MAFFT's alignment).
+                    If None, stdout is captured in a temporary file when keep_output
+                    is True and discarded otherwise.
+        keep_output: If True, return the captured output (e.g. for a log file).
+                    If False, it is only read back if the command fails.
+    
+    Returns:
+        Tuple (stdout, stderr) of decoded text. Output that was not captured or
+        not read back is returned as "".
+    
+    Raises:
+        subprocess.CalledProcessError: If the command exits with a non-zero status
+                                      (with the captured stdout/stderr attached)
+        FileNotFoundError: If the executable is not found
+    """
+    with tempfile.TemporaryFile() as out_f, tempfile.TemporaryFile() as err_f:
+        if stdout_file is not None:
+            stdout_target = stdout_file
+        elif keep_output:
+            stdout_target = out_f
+        else:
+            stdout_target = subprocess.DEVNULL
+        
+        returncode = subprocess.run(cmd, stdout=stdout_target, stderr=err_f).returncode
+        
+        read_back = keep_output or returncode != 0
+        stdout = _read_captured(out_f) if read_back and stdout_target is out_f else ""
+        stderr = _read_captured(err_f) if read_back else ""
+    
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd, output=stdout, stderr=stderr)
+    return stdout, stderr
+
+
+def _available_cpu_count() -> int:
+    """
+    Number of CPUs this process may run on.
+    
+    Uses the CPU affinity mask where available, so limits set by containers or batch
+    schedulers (e.g. Slurm, taskset) are respected, unlike os.cpu_count(), which
+    reports every CPU of the machine.
+    
+    Returns:
+        Number of CPUs (at least 1).
+    """
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:
+        # sched_getaffinity is not available on macOS/Windows
+        return os.cpu_count() or 1
+
+
+def _default_thread_count() -> int:
+    """
+    Number of threads to use by default: one per physical CPU core available.
+    
+    Hyperthreads add little to MAFFT's compute-bound alignment and can slow it down,
+    so on Linux the physical cores are counted from /proc/cpuinfo. The result is
+    capped by the CPUs this process may run on (CPU affinity, e.g. in containers or
+    batch jobs). Elsewhere, all available CPUs are used.
+    
+    Returns:
+        Number of threads (at least 1).
+    """
+    available = _available_cpu_count()
+    
+    # Each processor block in /proc/cpuinfo has a "physical id" (socket) and a
+    # "core id"; hyperthreads of the same core share both
+    cores = set()
+    try:
+        with open("/proc/cpuinfo") as f:
+            physical_id = core_id = None
+            for line in f:
+                key, _, value = line.partition(":")
+                key = key.strip()
+                if key == "physical id":
+                    physical_id = value.strip()
+                elif key == "core id":
+                    core_id = value.strip()
+                elif not line.strip():
+                    # Blank line: end of a processor block
+                    if core_id is not None:
+                        cores.add((physical_id, core_id))
+                    physical_id = core_id = None
+            if core_id is not None:
+                cores.add((physical_id, core_id))
+    except OSError:
+        pass
+    
+    return max(1, min(available, len(cores))) if cores else available
+
+
+def _count_fasta_records(fasta_file: str) -> int:
+    """
+    Count the records (header lines) in a FASTA file.
+    
+    The file is scanned in 1 MiB blocks with bytes.count(b'\\n>'), which runs in C,
+    instead of being split into lines in Python, so counting is cheap even for
+    large inputs.
+    
+    Args:
+        fasta_file: Path to a FASTA file
+    
+    Returns:
+        Number of lines starting with '>'.
+    """
+    n_records = 0
+    previous_end = b'\n'  # The start of the file counts as the start of a line
+    with open(fasta_file, 'rb') as f:
+        for block in iter(partial(f.read, 1 << 20), b''):
+            # Headers whose newline is at the end of the previous block
+            if previous_end == b'\n' and block[:1] == b'>':
+                n_records += 1
+            n_records += block.count(b'\n>')
+            previous_end = block[-1:]
+    return n_records
+
+
 def run_mafft_alignment(
     input_fasta: str,
     output_fasta: str,
@@ -16,26 +215,41 @@ def run_mafft_alignment(
     ep: Optional[float] = None,
     threads: Optional[int] = None,
     log_file: Optional[str] = None,
-    verbose: bool = True
+    verbose: bool = True,
+    auto_fast: bool = False,
+    auto_fast_threshold: int = 2000
 ) -> dict:
     """
     Run MAFFT multiple sequence alignment on a FASTA file.
     
     Args:
         input_fasta: Path to input FASTA file containing sequences to align
-        output_fasta: Path to output aligned FASTA file
+        output_fasta: Path to output aligned FASTA file. The alignment is written to
+                     '{output_fasta}.tmp' and only replaces output_fasta once MAFFT
+                     succeeds; if it fails, an existing output_fasta is left as it was.
         algorithm: Algorithm to use:
                   - "auto": Automatically select (default for MAFFT)
                   - "linsi": High accuracy, local pairwise (recommended for proteins)
                   - "einsi": High accuracy, genafpair
                   - "ginsi": High accuracy, globalpair
                   - "fast": High speed (--retree 1)
+                  - "parttree": Fast guide tree for very large inputs
+                    (--parttree --retree 1 --partsize 1000)
         maxiterate: Maximum number of iterative refinement (overrides algorithm default)
         op: Gap opening penalty (default: 1.53)
         ep: Offset/gap extension penalty (default: 0.0)
-        threads: Number of threads (-1 for auto, None to use all available CPUs)
+        threads: Number of threads (-1 for MAFFT's own choice, None to use one thread
+                per available physical CPU core)
         log_file: Path to log file for saving full MAFFT output (default: None, no log saved)
         verbose: Print progress messages (default: True)
+        auto_fast: If True, switch to the PartTree method (--parttree --retree 1
+                  --partsize 1000) when the input has more than auto_fast_threshold
+                  sequences (default: False). The accurate algorithms scale
+                  quadratically with the number of sequences and become impractical
+                  for many thousands of them; PartTree builds the guide tree in
+                  O(N log N) at some cost in accuracy.
+        auto_fast_threshold: Number of sequences above which auto_fast switches to
+                            PartTree (default: 2000)
     
     Returns:
         Dictionary with:
@@ -53,11 +267,22 @@ def run_mafft_alignment(
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
     
+    # Use PartTree for large inputs if requested
+    if auto_fast:
+        n_sequences = _count_fasta_records(input_fasta)
+        if n_sequences > auto_fast_threshold:
+            if verbose:
+                print(f"{n_sequences} sequences (> {auto_fast_threshold}): using MAFFT PartTree "
+                      f"instead of algorithm '{algorithm}'")
+            algorithm = "parttree"
+    
     # Build command
     cmd = ["mafft"]
     
     # Algorithm selection
-    if algorithm == "auto":
+    if algorithm == "parttree":
+        cmd.extend(["--parttree", "--retree", "1", "--partsize", "1000"])
+    elif algorithm == "auto":
         cmd.append("--auto")
     elif algorithm == "fast":
         cmd.extend(["--retree", "1"])
@@ -84,9 +309,9 @@ def run_mafft_alignment(
     if ep is not None:
         cmd.extend(["--ep", str(ep)])
     
-    # Threads (default to -1 for auto if not specified)
+    # Threads (default to one per available physical core if not specified)
     if threads is None:
-        threads = -1
+        threads = _default_thread_count()
     cmd.extend(["--thread", str(threads)])
     
     # Input file
@@ -96,38 +321,28 @@ def run_mafft_alignment(
         print(f"Running MAFFT alignment (algorithm: {algorithm})...")
     
     # Run command
+    # The alignment is written next to output_fasta and only moved into place once
+    # MAFFT succeeds, so a failed run leaves an existing alignment untouched
+    tmp_fasta = f"{output_fasta}.tmp"
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        # Write alignment output to file
-        with open(output_fasta, 'w') as f:
-            f.write(result.stdout)
+        # MAFFT writes the alignment to stdout: send it straight to the output file
+        # instead of holding it in memory. Its (chatty) progress output on stderr is
+        # only read back for the log or an error message.
+        with open(tmp_fasta, 'wb') as out_f:
+            _, stderr = _run_to_files(cmd, stdout_file=out_f, keep_output=bool(log_file))
+        os.replace(tmp_fasta, output_fasta)
         
         # Save log file if requested
         if log_file:
-            with open(log_file, 'w') as f:
-                f.write("=" * 80 + "\n")
-                f.write("MAFFT Alignment Log\n")
-                f.write("=" * 80 + "\n")
-                f.write(f"Command: {' '.join(cmd)}\n")
-                f.write(f"Algorithm: {algorithm}\n")
-                f.write(f"Input: {input_fasta}\n")
-                f.write(f"Output: {output_fasta}\n")
-                f.write("\n" + "=" * 80 + "\n")
-                f.write("STDOUT:\n")
-                f.write("=" * 80 + "\n")
-                if result.stderr:
-                    f.write(result.stderr)
-                f.write("\n" + "=" * 80 + "\n")
-                f.write("STDERR:\n")
-                f.write("=" * 80 + "\n")
-                if result.stderr:
-                    f.write(result.stderr)
+            # MAFFT's stdout is the alignment itself, written to the output file
+            _write_log(
+                log_file,
+                "MAFFT Alignment Log",
+                [("Command", ' '.join(cmd)), ("Algorithm", algorithm),
+                 ("Input", input_fasta), ("Output", output_fasta)],
+                stdout=f"(alignment written to {output_fasta})\n",
+                stderr=stderr
+            )
         
         if verbose:
             print(f"Alignment completed successfully: {output_fasta}")
@@ -148,14 +363,10 @@ def run_mafft_alignment(
         
         # Save error to log file if requested
         if log_file:
-            with open(log_file, 'w') as f:
-                f.write("=" * 80 + "\n")
-                f.write("MAFFT Alignment Log - ERROR\n")
-                f.write("=" * 80 + "\n")
-                f.write(f"Command: {' '.join(cmd)}\n")
-                f.write(f"Return code: {e.returncode}\n")
-                f.write(f"STDOUT:\n{e.stdout}\n")
-                f.write(f"STDERR:\n{e.stderr}\n")
+            _write_error_log(
+                log_file, "MAFFT Alignment Log", cmd, e.returncode,
+                stdout="(alignment output discarded)", stderr=e.stderr
+            )
         
         if verbose:
             print(f"Error: {error_msg}")
@@ -176,6 +387,10 @@ def run_mafft_alignment(
             "success": False,
             "error": error_msg
         }
+    finally:
+        # Don't leave a partial alignment behind
+        if os.path.exists(tmp_fasta):
+            os.remove(tmp_fasta)
 
 
 def run_clipkit_trimming(
@@ -263,34 +478,20 @@ def run_clipkit_trimming(
     
     # Run command
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        # ClipKIT writes the trimmed alignment itself (-o); its console output is only
+        # needed for the log file, so it is discarded when no log is requested
+        stdout, stderr = _run_to_files(cmd, keep_output=bool(log_file))
         
         # Save log file if requested (contains full ClipKIT output)
         if log_file:
-            with open(log_file, 'w') as f:
-                f.write("=" * 80 + "\n")
-                f.write("ClipKIT Trimming Log\n")
-                f.write("=" * 80 + "\n")
-                f.write(f"Command: {' '.join(cmd)}\n")
-                f.write(f"Mode: {mode}\n")
-                f.write(f"Gaps threshold: {gaps}\n")
-                f.write(f"Input: {input_alignment}\n")
-                f.write(f"Output: {output_alignment}\n")
-                f.write("\n" + "=" * 80 + "\n")
-                f.write("STDOUT:\n")
-                f.write("=" * 80 + "\n")
-                if result.stdout:
-                    f.write(result.stdout)
-                f.write("\n" + "=" * 80 + "\n")
-                f.write("STDERR:\n")
-                f.write("=" * 80 + "\n")
-                if result.stderr:
-                    f.write(result.stderr)
+            _write_log(
+                log_file,
+                "ClipKIT Trimming Log",
+                [("Command", ' '.join(cmd)), ("Mode", mode), ("Gaps threshold", gaps),
+                 ("Input", input_alignment), ("Output", output_alignment)],
+                stdout=stdout,
+                stderr=stderr
+            )
         
         if verbose:
             print(f"Trimming completed successfully: {output_alignment}")
@@ -311,14 +512,10 @@ def run_clipkit_trimming(
         
         # Save error to log file if requested
         if log_file:
-            with open(log_file, 'w') as f:
-                f.write("=" * 80 + "\n")
-                f.write("ClipKIT Trimming Log - ERROR\n")
-                f.write("=" * 80 + "\n")
-                f.write(f"Command: {' '.join(cmd)}\n")
-                f.write(f"Return code: {e.returncode}\n")
-                f.write(f"STDOUT:\n{e.stdout}\n")
-                f.write(f"STDERR:\n{e.stderr}\n")
+            _write_error_log(
+                log_file, "ClipKIT Trimming Log", cmd, e.returncode,
+                stdout=e.stdout, stderr=e.stderr
+            )
         
         if verbose:
             print(f"Error: {error_msg}")
@@ -347,7 +544,8 @@ def prepare_sequences_for_phylogeny(
     mafft_algorithm: str = "linsi",
     clipkit_mode: str = "smart-gap",
     save_logs: bool = True,
-    verbose: bool = True
+    verbose: bool = True,
+    mafft_auto_fast: bool = False
 ) -> dict:
     """
     Complete workflow to prepare sequences for phylogenetic tree building.
@@ -365,6 +563,8 @@ def prepare_sequences_for_phylogeny(
         clipkit_mode: ClipKIT trimming mode (default: "smart-gap")
         save_logs: If True, save full command output to log files (default: True)
         verbose: Print progress messages (default: True)
+        mafft_auto_fast: If True, use MAFFT PartTree for large inputs instead of
+                        mafft_algorithm (see run_mafft_alignment's auto_fast; default: False)
     
     Returns:
         Dictionary with:
@@ -392,7 +592,8 @@ def prepare_sequences_for_phylogeny(
         output_fasta=aligned_file,
         algorithm=mafft_algorithm,
         log_file=mafft_log_file,
-        verbose=verbose
+        verbose=verbose,
+        auto_fast=mafft_auto_fast
     )
     
     if not align_result["success"]:
@@ -3,16 +3,80 @@ UniProt API utilities for downloading and processing UniProt data.
 """
 import os
 import re
-import json
+import mmap
+import sys
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlencode
 import requests
 from requests.adapters import HTTPAdapter, Retry
+from utils import json_utils
 
 
 # Set up session with retries
-_re_next_link = re.compile(r'<(.+)>; rel="next"')
-_retries = Retry(total=5, backoff_factor=0.25, status_forcelist=[500, 502, 503, 504])
+# Matches the 'next' URL anywhere in a Link header that may also list other rels
+_re_next_link = re.compile(r'<([^>]+)>;\s*rel="next"', re.IGNORECASE)
+# 429 (Too Many Requests) is retried too, waiting as long as its Retry-After header asks
+_RETRY_OPTIONS = dict(
+    total=5,
+    backoff_factor=0.25,
+    status_forcelist=[429, 500, 502, 503, 504],
+    respect_retry_after_header=True
+)
+try:
+    _retries = Retry(allowed_methods=frozenset(['GET']), **_RETRY_OPTIONS)
+except TypeError:
+    # urllib3 < 1.26 names this option method_whitelist
+    _retries = Retry(method_whitelist=frozenset(['GET']), **_RETRY_OPTIONS)
 _session = requests.Session()
-_session.mount("https://", HTTPAdapter(max_retries=_retries))
+# One adapter (and so one pool of kept-alive connections) for both schemes,
+# sized so the prefetch thread never has to open a fresh connection
+_adapter = HTTPAdapter(max_retries=_retries, pool_connections=32, pool_maxsize=32, pool_block=False)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+# Ask for compressed JSON explicitly rather than relying on the requests defaults
+_session.headers.update({
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+    "User-Agent": "capsid-extractor/1.0"
+})
+
+# Feature descriptions containing "capsid" but not "nucleocapsid" (case-insensitive),
+# tested in one pass without building a lowercased copy of each description
+_re_capsid_description = re.compile(r'^(?!.*nucleocapsid).*capsid', re.IGNORECASE | re.DOTALL)
+
+# Plain literal search used to reject most descriptions before the lookahead above
+_re_capsid = re.compile(r'capsid', re.IGNORECASE)
+
+# Raw JSON of an entry that can have capsid features contains "capsid" (in any case);
+# entries without it are skipped before being parsed
+_re_capsid_bytes = re.compile(rb'capsid', re.IGNORECASE)
+
+# Below this many requests left in the current rate limit window (X-Rate-Limit-Remaining),
+# the next page is requested after a delay of _RATE_LIMIT_DELAY seconds per missing request
+_RATE_LIMIT_LOW = 10
+_RATE_LIMIT_DELAY = 0.1
+
+# Shared read-only default for missing nested objects in UniProt entries
+_EMPTY = {}
+
+# Maximum number of serialized entries waiting for the snapshot writer thread
+_WRITE_QUEUE_SIZE = 1000
+
+# Name of the single file entries are saved to with output_format='jsonl'
+_JSONL_FILENAME = 'entries.jsonl'
+
+# File listing the '{primaryAccession}.json' files written by downloads with
+# output_format='files', so a later 'jsonl' download removes only those
+_FILES_MANIFEST = 'downloaded_entries.txt'
+
+# Write buffer size for the JSON Lines snapshot file
+_JSONL_BUFFER_SIZE = 1 << 20
+
+# Entry files at least this large are memory-mapped instead of read into a buffer
+_MMAP_MIN_SIZE = 1 << 20
 
 
 def get_next_link(headers):
@@ -32,15 +96,61 @@ def get_next_link(headers):
     Example:
         Link header: '<https://rest.uniprot.org/uniprotkb/search?cursor=...>; rel="next"'
         Returns: 'https://rest.uniprot.org/uniprotkb/search?cursor=...'
+    
+    Note:
+        The 'next' link is found wherever it appears among comma-separated links
+        (e.g. after a 'prev' link), and the rel name is matched case-insensitively.
     """
     if "Link" in headers:
-        match = _re_next_link.match(headers["Link"])
+        match = _re_next_link.search(headers["Link"])
         if match:
             return match.group(1)
     return None
 
 
-def get_batch(batch_url, session=None):
+def _rate_limit_delay(headers):
+    """
+    Compute how long to wait before the next request, based on the rate limit headers.
+    
+    Args:
+        headers: Dictionary-like object containing HTTP response headers.
+    
+    Returns:
+        Delay in seconds: 0 unless the X-Rate-Limit-Remaining header reports fewer
+        than _RATE_LIMIT_LOW requests left, then growing as the remaining count drops.
+    """
+    try:
+        remaining = int(headers.get("X-Rate-Limit-Remaining"))
+    except (TypeError, ValueError):
+        # Header missing or not a number: no rate limit information
+        return 0
+    return max(_RATE_LIMIT_LOW - remaining, 0) * _RATE_LIMIT_DELAY
+
+
+def _fetch_page(session, url, decode=False, delay=0):
+    """
+    Fetch one page of UniProt results and raise on HTTP errors.
+    
+    Args:
+        session: requests.Session used for the request.
+        url: URL of the page to fetch.
+        decode: If True, also decode the JSON payload of the page.
+        delay: Seconds to wait before sending the request (default: 0).
+    
+    Returns:
+        Tuple of (response, data), where data is the decoded JSON payload if
+        decode is True, None otherwise.
+    """
+    if delay:
+        time.sleep(delay)
+    response = session.get(url)
+    response.raise_for_status()
+    if decode:
+        return response, json_utils.loads(response.content)
+    return response, None
+
+
+def get_batch(batch_url, session=None, prefetch=True, decode=False):
     """
     Generator that yields batch responses from UniProt API with automatic pagination.
     
@@ -54,10 +164,18 @@ def get_batch(batch_url, session=None):
         session: Optional requests.Session object. If not provided, uses the default
                 session configured with retry logic. Useful for custom session
                 configuration or testing.
+        prefetch: If True (default), the next page is requested in a background
+                 thread as soon as its link is known, so downloading it overlaps
+                 with the caller processing the current page. If False, pages are
+                 fetched strictly one after another.
+        decode: If True, the JSON payload of each page is decoded (in the background
+               thread when prefetching) and yielded instead of the response object
+               (default: False).
     
     Yields:
         Tuple of (response, total) where:
-            - response: requests.Response object containing the current page of results
+            - response: requests.Response object containing the current page of results,
+                       or its decoded JSON payload (a dict) if decode is True
             - total: Total number of results available (from X-Total-Results header),
                     or None if header is not present
     
@@ -68,19 +186,291 @@ def get_batch(batch_url, session=None):
         The generator will continue until no 'next' link is found in the response headers.
         Each yielded response contains a JSON payload with 'results' key containing
         the entries for that page.
+        UniProt uses cursor-based pagination, so the URL of a page is only known once
+        the previous page has been received; at most one page is fetched ahead.
+        With decode=True, decoding a page also overlaps with the caller processing
+        the previous one, instead of adding to the time between network requests.
+        Rate limiting: 429 responses are retried by the session (honoring Retry-After),
+        and when a response reports that few requests are left in the current rate
+        limit window (X-Rate-Limit-Remaining), the next page is requested after a
+        short delay instead of running into the limit.
     """
     if session is None:
         session = _session
     
-    while batch_url:
-        response = session.get(batch_url)
-        response.raise_for_status()
-        total = response.headers.get("x-total-results", None)
-        yield response, total
-        batch_url = get_next_link(response.headers)
+    delay = 0
+    if not prefetch:
+        while batch_url:
+            response, data = _fetch_page(session, batch_url, decode, delay)
+            total = response.headers.get("x-total-results", None)
+            yield (data if decode else response), total
+            batch_url = get_next_link(response.headers)
+            delay = _rate_limit_delay(response.headers)
+        return
+    
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(_fetch_page, session, batch_url, decode) if batch_url else None
+        while future is not None:
+            response, data = future.result()
+            # Start downloading the next page before handing this one to the caller
+            next_url = get_next_link(response.headers)
+            delay = _rate_limit_delay(response.headers)
+            future = executor.submit(_fetch_page, session, next_url, decode, delay) if next_url else None
+            total = response.headers.get("x-total-results", None)
+            yield (data if decode else response), total
+
+
+def _write_file(path, payload):
+    """
+    Write bytes to a file, replacing it if it exists.
+    
+    Uses unbuffered os-level calls: each snapshot file is written in one go, so
+    Python's buffered file objects would only add overhead.
+    
+    Args:
+        path: Path of the file to write.
+        payload: bytes to write.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _write_files(file_queue, errors, verbose=False):
+    """
+    Write (path, payload) items taken from a queue until a None item is received.
+    
+    Runs in the snapshot writer thread of stream_uniprot_entries().
+    
+    Args:
+        file_queue: queue.Queue of (path, bytes) tuples, terminated by None.
+        errors: List the first write error is appended to. After an error the
+               queue is still drained (without writing), so producers never block.
+        verbose: If True, prints each file once it has been written (default: False).
+    """
+    while True:
+        item = file_queue.get()
+        if item is None:
+            return
+        if errors:
+            continue
+        try:
+            _write_file(*item)
+        except OSError as e:
+            errors.append(e)
+            continue
+        if verbose:
+            print(f"Saved {item[0]}")
+
+
+def _read_files_manifest(outdir):
+    """
+    Read the names of the entry files previous 'files' downloads wrote to outdir.
+    
+    Args:
+        outdir: Snapshot directory.
+    
+    Returns:
+        Set of file names (without directory), empty if there is no manifest.
+    """
+    try:
+        with open(os.path.join(outdir, _FILES_MANIFEST)) as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def _record_written_files(outdir, written_names):
+    """
+    Add the names of entry files written by a 'files' download to the manifest.
+    
+    Called whether or not the download completed, so that files written by an
+    interrupted download are also removed by a later 'jsonl' download.
+    
+    Args:
+        outdir: Snapshot directory.
+        written_names: Names of the '{primaryAccession}.json' files written.
+    """
+    manifest_path = os.path.join(outdir, _FILES_MANIFEST)
+    names = _read_files_manifest(outdir) | written_names
+    # Replace the manifest atomically
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.writelines(f"{name}\n" for name in sorted(names))
+    os.replace(tmp_path, manifest_path)
+
+
+def _finish_snapshot(outdir, output_format, verbose=False):
+    """
+    Remove the other snapshot layout from outdir once a download has completed.
+    
+    Only files written by earlier downloads are removed: 'entries.jsonl' after a
+    'files' download, and the '{primaryAccession}.json' files listed in the
+    manifest (_FILES_MANIFEST) after a 'jsonl' download. Files put in outdir by
+    anything else are left alone.
+    
+    Args:
+        outdir: Snapshot directory.
+        output_format: Format of the download that just completed, 'files' or 'jsonl'.
+        verbose: If True, prints what was removed (default: False).
+    """
+    manifest_path = os.path.join(outdir, _FILES_MANIFEST)
+    if output_format == 'files':
+        stale_paths = [os.path.join(outdir, _JSONL_FILENAME)]
+    else:
+        stale_paths = [os.path.join(outdir, name) for name in sorted(_read_files_manifest(outdir))]
+        stale_paths.append(manifest_path)
+    
+    n_removed = 0
+    for path in stale_paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        if path != manifest_path:
+            n_removed += 1
+    if verbose and n_removed:
+        print(f"Removed {n_removed} file(s) of the previous snapshot in {outdir}")
+
+
+def stream_uniprot_entries(query='taxonomy_id:327045 AND gene:gag', batch_size=500, outdir=None, verbose=False, fields=None,
+                           output_format='files'):
+    """
+    Generator that yields UniProt entries matching a query as they are downloaded.
+    
+    Entries are yielded one at a time as each page of results is decoded, so
+    callers can process them while the rest of the query is still being
+    fetched, without first writing everything to disk and reading it back.
+    Handles pagination automatically to retrieve all results.
+    
+    Args:
+        query: UniProt query string using UniProt query syntax.
+              Examples:
+              - 'taxonomy_id:327045 AND gene:gag' (Orthoretrovirinae Gag proteins)
+              - 'reviewed:true AND organism:"Homo sapiens"'
+              - 'accession:P12345'
+              See UniProt documentation for full query syntax.
+        batch_size: Number of results to retrieve per API request (default: 500).
+                   Larger values reduce API calls but may hit rate limits.
+                   Maximum recommended: 500.
+        outdir: Optional output directory. If provided, each entry is also saved
+               in this directory (created if it doesn't exist), keeping a copy of
+               the raw data for reproducibility (see output_format).
+               If None (default), nothing is written to disk.
+        verbose: If True, prints each file saved. If False, shows progress dots (default: False).
+        fields: Optional list of UniProt return fields (e.g. ['accession', 'id',
+               'organism_name', 'sequence', 'ft_chain']). If provided, UniProt only
+               returns these parts of each entry, which avoids downloading and
+               parsing unused sections such as references and comments.
+               If None (default), complete entries are returned.
+        output_format: How entries are saved to outdir:
+                      - 'files' (default): one '{primaryAccession}.json' file per entry
+                        ('entry_{index}.json' if primaryAccession is missing)
+                      - 'jsonl': a single 'entries.jsonl' file with one entry per line,
+                        which avoids creating (and later opening) thousands of small files
+    
+    Yields:
+        UniProt entry dictionaries, in the order returned by the API.
+    
+    Raises:
+        ValueError: If output_format is not 'files' or 'jsonl'.
+        OSError: If an entry file cannot be written.
+    
+    Note:
+        Uses the default session with retry logic (5 retries with exponential backoff).
+        With output_format='files', entry files are written by a background thread;
+        all of them have been written once the generator is exhausted (or closed).
+        Both formats can be read back with iter_uniprot_jsons() and
+        extract_capsid_features_from_jsons(), which read 'entries.jsonl' if it exists
+        and the '.json' files otherwise. With 'jsonl', entries are written to
+        'entries.jsonl.tmp', which only replaces 'entries.jsonl' once the last page
+        has been downloaded, so a failed or interrupted download leaves the previous
+        snapshot as it was. Only after a download has completed is the snapshot in
+        the other format removed, and then only the files earlier downloads wrote
+        (see _finish_snapshot).
+    """
+    if output_format not in ('files', 'jsonl'):
+        raise ValueError(f"output_format must be 'files' or 'jsonl', not {output_format!r}")
+    jsonl_file = None
+    writer = None
+    if outdir is not None:
+        os.makedirs(outdir, exist_ok=True)
+        written_names = set()
+        if output_format == 'jsonl':
+            # One buffered file for all entries, moved into place once complete
+            jsonl_path = os.path.join(outdir, _JSONL_FILENAME)
+            jsonl_tmp_path = f"{jsonl_path}.tmp"
+            jsonl_file = open(jsonl_tmp_path, 'wb', buffering=_JSONL_BUFFER_SIZE)
+        else:
+            # Files are written by a background thread, so that writing thousands of
+            # small files does not hold up downloading and processing the entries
+            file_queue = queue.Queue(maxsize=_WRITE_QUEUE_SIZE)
+            write_errors = []
+            writer = threading.Thread(target=_write_files, args=(file_queue, write_errors, verbose), daemon=True)
+            writer.start()
+    base_url = "https://rest.uniprot.org/uniprotkb/search"
+    params = {
+        "query": query,
+        "format": "json",
+        "size": batch_size
+    }
+    if fields:
+        params["fields"] = ",".join(fields)
+    url = f"{base_url}?{urlencode(params)}"
+    n_entries = 0
+    completed = False
+    try:
+        # Pages are decoded in get_batch's prefetch thread, overlapping with the
+        # processing of the previous page
+        for data, total in get_batch(url, decode=True):
+            for entry in data.get('results', []):
+                n_entries += 1
+                if outdir is not None:
+                    # Compact UTF-8 JSON bytes (serialized with orjson when installed)
+                    payload = json_utils.dumps(entry)
+                    if jsonl_file is not None:
+                        jsonl_file.write(payload)
+                        jsonl_file.write(b'\n')
+                    else:
+                        if write_errors:
+                            raise write_errors[0]
+                        accession = entry.get('primaryAccession', f'entry_{n_entries}')
+                        written_names.add(f"{accession}.json")
+                        outpath = os.path.join(outdir, f"{accession}.json")
+                        file_queue.put((outpath, payload))
+                if not verbose and n_entries % 50 == 0:
+                    print(".", end="", flush=True)
+                yield entry
+        completed = True
+    finally:
+        if jsonl_file is not None:
+            jsonl_file.close()
+            if not completed:
+                # Keep the previous snapshot: drop the incomplete one
+                os.remove(jsonl_tmp_path)
+        if writer is not None:
+            # Wait for the remaining files to be written
+            file_queue.put(None)
+            writer.join()
+            _record_written_files(outdir, written_names)
+    if writer is not None and write_errors:
+        raise write_errors[0]
+    if outdir is not None:
+        if jsonl_file is not None:
+            os.replace(jsonl_tmp_path, jsonl_path)
+            if verbose:
+                print(f"Saved {n_entries} entries to {jsonl_path}")
+        _finish_snapshot(outdir, output_format, verbose)
+    if not verbose and n_entries > 0:
+        print()  # New line after progress dots
 
 
-def download_uniprot_jsons(query='taxonomy_id:327045 AND gene:gag', batch_size=500, outdir='jsons', verbose=False):
+def download_uniprot_jsons(query='taxonomy_id:327045 AND gene:gag', batch_size=500, outdir='jsons', verbose=False, fields=None,
+                           output_format='files'):
     """
     Download UniProt entries matching a query as individual JSON files.
     
@@ -103,43 +493,281 @@ def download_uniprot_jsons(query='taxonomy_id:327045 AND gene:gag', batch_size=5
                Each entry is saved as '{primaryAccession}.json'.
                If primaryAccession is missing, uses 'entry_{index}.json'.
         verbose: If True, prints each file saved. If False, shows progress dots (default: False).
+        fields: Optional list of UniProt return fields to restrict each entry to
+               (default: None, complete entries). See stream_uniprot_entries().
+        output_format: 'files' (default) for one JSON file per entry, or 'jsonl'
+                      for a single 'entries.jsonl' file. See stream_uniprot_entries().
     
     Returns:
         int: Total number of entries downloaded
     
     Note:
-        Uses the default session with retry logic (5 retries with exponential backoff).
-        Prints progress summary. If verbose=True, prints each file saved.
-        If an entry lacks a primaryAccession, generates a default filename.
+        Thin wrapper around stream_uniprot_entries() for callers that only need
+        the files on disk. Prints progress summary.
     """
-    os.makedirs(outdir, exist_ok=True)
-    base_url = "https://rest.uniprot.org/uniprotkb/search"
-    params = {
-        "query": query,
-        "format": "json",
-        "size": batch_size
-    }
-    url = requests.Request('GET', base_url, params=params).prepare().url
     total_downloaded = 0
-    for response, total in get_batch(url):
-        data = response.json()
-        for entry in data.get('results', []):
-            accession = entry.get('primaryAccession', f'entry_{total_downloaded+1}')
-            outpath = os.path.join(outdir, f"{accession}.json")
-            with open(outpath, "w") as f:
-                json.dump(entry, f)
-            total_downloaded += 1
-            if verbose:
-                print(f"Saved {outpath}")
-            elif total_downloaded % 50 == 0:
-                print(".", end="", flush=True)
-    if not verbose and total_downloaded > 0:
-        print()  # New line after progress dots
-    print(f"Downloaded {total_downloaded} entries as individual JSON files.")
+    entries = stream_uniprot_entries(
+        query=query, batch_size=batch_size, outdir=outdir, verbose=verbose, fields=fields,
+        output_format=output_format
+    )
+    for _ in entries:
+        total_downloaded += 1
+    if output_format == 'jsonl':
+        print(f"Downloaded {total_downloaded} entries to {os.path.join(outdir, _JSONL_FILENAME)}.")
+    else:
+        print(f"Downloaded {total_downloaded} entries as individual JSON files.")
     return total_downloaded
 
 
-def extract_capsid_features_from_entry(entry):
+def load_uniprot_json(json_path):
+    """
+    Load a single UniProt entry saved by download_uniprot_jsons().
+    
+    The file is read as raw bytes and decoded in one call, which lets the
+    fast orjson parser (when installed) work directly on the buffer instead
+    of going through a text-mode file object.
+    
+    Args:
+        json_path: Path to a UniProt entry JSON file.
+    
+    Returns:
+        UniProt entry dictionary.
+    
+    Note:
+        Files of at least _MMAP_MIN_SIZE bytes are memory-mapped and parsed
+        straight from the page cache, avoiding a copy into a Python buffer.
+        Typical SwissProt entries are only tens of KB, where the cost of
+        setting up a mapping outweighs the copy, so those are read directly.
+    """
+    return _load_uniprot_json(json_path)
+
+
+def _load_uniprot_json(json_path, prefilter=None):
+    """
+    Load a UniProt entry file, optionally skipping it based on its raw bytes.
+    
+    Args:
+        json_path: Path to a UniProt entry JSON file.
+        prefilter: Optional compiled bytes regex. If given, the file is only
+                  parsed if the pattern is found in its raw contents.
+    
+    Returns:
+        UniProt entry dictionary, or None if prefilter did not match.
+    """
+    with open(json_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _MMAP_MIN_SIZE:
+            data = f.read()
+            if prefilter is not None and not prefilter.search(data):
+                return None
+            return json_utils.loads(data)
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if prefilter is not None and not prefilter.search(mm):
+                return None
+            view = memoryview(mm)
+            try:
+                return json_utils.loads(view)
+            finally:
+                view.release()
+
+
+def _list_uniprot_jsons(json_dir):
+    """
+    List the UniProt entry files saved in a directory.
+    
+    Args:
+        json_dir: Directory containing '{primaryAccession}.json' files.
+    
+    Returns:
+        List of paths to the '.json' files in the directory.
+    """
+    # os.scandir entries already carry the joined path
+    with os.scandir(json_dir) as it:
+        return [e.path for e in it if e.name.endswith('.json')]
+
+
+def _read_jsonl_lines(json_dir):
+    """
+    Read the entries saved in a directory's 'entries.jsonl' file, if there is one.
+    
+    Args:
+        json_dir: Directory possibly containing an 'entries.jsonl' file, as written
+                 by stream_uniprot_entries(output_format='jsonl').
+    
+    Returns:
+        List of the non-empty lines of the file as bytes (one JSON entry each),
+        or None if the directory has no 'entries.jsonl' file.
+    """
+    try:
+        with open(os.path.join(json_dir, _JSONL_FILENAME), 'rb') as f:
+            return [line for line in f if not line.isspace()]
+    except FileNotFoundError:
+        return None
+
+
+def _snapshot_sources(json_dir):
+    """
+    Pick the snapshot layout to read from a directory.
+    
+    A directory is read in exactly one layout: 'entries.jsonl' if it exists,
+    otherwise the '{primaryAccession}.json' files, so two snapshots left in the
+    same directory are never read together.
+    
+    Args:
+        json_dir: Snapshot directory.
+    
+    Returns:
+        Tuple of (json_paths, jsonl_lines), one of which is empty.
+    """
+    json_paths = _list_uniprot_jsons(json_dir)
+    jsonl_lines = _read_jsonl_lines(json_dir)
+    if jsonl_lines is None:
+        return json_paths, []
+    if json_paths:
+        print(f"Warning: {json_dir} contains both {_JSONL_FILENAME} and {len(json_paths)} "
+              f"'.json' entry files; reading {_JSONL_FILENAME} only")
+    return [], jsonl_lines
+
+
+def iter_uniprot_jsons(json_dir):
+    """
+    Generator that yields UniProt entries previously saved as individual JSON files.
+    
+    Useful to reprocess a downloaded snapshot (e.g. the example data in
+    'outputs/') without querying the UniProt API again.
+    
+    Args:
+        json_dir: Directory containing '{primaryAccession}.json' files and/or an
+                 'entries.jsonl' file, as written by stream_uniprot_entries() or
+                 download_uniprot_jsons().
+    
+    Yields:
+        UniProt entry dictionaries, one per line of 'entries.jsonl' if the directory
+        has one, otherwise one per '.json' file in the directory.
+    """
+    json_paths, jsonl_lines = _snapshot_sources(json_dir)
+    for json_path in json_paths:
+        yield load_uniprot_json(json_path)
+    for line in jsonl_lines:
+        yield json_utils.loads(line)
+
+
+def _extract_capsid_features_from_json(json_path):
+    """
+    Load a saved UniProt entry and extract its capsid features.
+    
+    Module-level so it can be pickled and run in worker processes.
+    
+    Args:
+        json_path: Path to a UniProt entry JSON file.
+    
+    Returns:
+        List of capsid hit dictionaries (see extract_capsid_features_from_entry).
+    
+    Note:
+        Files that do not contain "capsid" anywhere cannot have capsid features
+        and are not parsed at all.
+    """
+    entry = _load_uniprot_json(json_path, prefilter=_re_capsid_bytes)
+    if entry is None:
+        return []
+    return extract_capsid_features_from_entry(entry)
+
+
+def _extract_capsid_features_from_jsonl_line(line):
+    """
+    Decode one line of an 'entries.jsonl' file and extract its capsid features.
+    
+    Module-level so it can be pickled and run in worker processes.
+    
+    Args:
+        line: bytes containing one UniProt entry as JSON.
+    
+    Returns:
+        List of capsid hit dictionaries (see extract_capsid_features_from_entry).
+    
+    Note:
+        Lines that do not contain "capsid" anywhere are not parsed at all.
+    """
+    if not _re_capsid_bytes.search(line):
+        return []
+    return extract_capsid_features_from_entry(json_utils.loads(line))
+
+
+def extract_capsid_features_from_jsons(json_dir, max_workers=None, chunk_size=64):
+    """
+    Extract capsid features from every UniProt entry saved in a directory, in parallel.
+    
+    Entries are independent, so the files are distributed over a process pool:
+    each worker loads and parses its own files and only sends the (small) hit
+    lists back to the parent process.
+    
+    Args:
+        json_dir: Directory containing '{primaryAccession}.json' files and/or an
+                 'entries.jsonl' file, as written by stream_uniprot_entries() or
+                 download_uniprot_jsons().
+        max_workers: Maximum number of worker processes (default: None, one per CPU).
+                    Use 1 to process the files serially in the current process.
+        chunk_size: Number of files (or 'entries.jsonl' lines) sent to a worker at a
+                   time (default: 64). Larger chunks amortize inter-process
+                   communication overhead. Directories with no more entries than
+                   this are processed serially.
+    
+    Returns:
+        List with one element per entry, each being the list of capsid hits
+        found in that entry (empty list if the entry has no capsid features).
+        The order follows the lines of 'entries.jsonl' if the directory has one,
+        otherwise the directory listing, and does not depend on scheduling.
+    """
+    json_paths, jsonl_lines = _snapshot_sources(json_dir)
+    
+    if max_workers == 1 or len(json_paths) + len(jsonl_lines) <= chunk_size:
+        return ([_extract_capsid_features_from_json(p) for p in json_paths]
+                + [_extract_capsid_features_from_jsonl_line(line) for line in jsonl_lines])
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        hits = list(executor.map(_extract_capsid_features_from_json, json_paths, chunksize=chunk_size))
+        hits.extend(executor.map(_extract_capsid_features_from_jsonl_line, jsonl_lines, chunksize=chunk_size))
+        return hits
+
+
+def extract_capsid_features_from_entries(entries, workers=None, chunk_size=64):
+    """
+    Extract capsid features from already loaded UniProt entries, in parallel.
+    
+    Counterpart of extract_capsid_features_from_jsons() for entries held in memory
+    (e.g. collected from stream_uniprot_entries()). Entries are independent, so they
+    are distributed over a process pool and only the hit lists are sent back.
+    
+    Args:
+        entries: Iterable of UniProt entry dictionaries.
+        workers: Maximum number of worker processes (default: None, one per CPU).
+                Use 1 to process the entries serially in the current process.
+        chunk_size: Number of entries sent to a worker at a time (default: 64).
+                   Larger chunks amortize inter-process communication overhead.
+                   Inputs with no more entries than this are processed serially.
+    
+    Returns:
+        List with one element per entry, each being the list of capsid hits
+        found in that entry (empty list if the entry has no capsid features),
+        in the same order as entries.
+    
+    Note:
+        Each entry has to be pickled to reach a worker, which costs about as much as
+        parsing it; the pool pays off for large batches of entries with many features.
+    """
+    entries = list(entries)
+    
+    if workers == 1 or len(entries) <= chunk_size:
+        return [extract_capsid_features_from_entry(entry) for entry in entries]
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(extract_capsid_features_from_entry, entries, chunksize=chunk_size))
+
+
+def extract_capsid_features_from_entry(entry: dict) -> list:
     """
     Extract capsid protein features from a UniProt entry with complete metadata.
     
@@ -177,6 +805,8 @@ def extract_capsid_features_from_entry(entry):
     
     Note:
         Returns empty list if no matching capsid features are found.
+        Hits from the same entry share their 'organism' dict and 'organismHosts'
+        list, which callers must treat as read-only.
         Sequence positions are 1-based and inclusive (UniProt standard).
         The extracted sequence is the substring from start_pos-1 to end_pos (0-based indexing).
     """
@@ -184,74 +814,87 @@ def extract_capsid_features_from_entry(entry):
     
     # Get full protein sequence (needed to extract capsid subsequence)
     full_sequence = entry.get("sequence", {}).get("value", "")
+    seq_len = len(full_sequence)  # 0 if the sequence is missing
     
     # Extract basic entry metadata
-    primary_accession = entry.get("primaryAccession", "")
+    # (identifiers are interned: they are repeated across hits and used as lookup keys)
+    primary_accession = sys.intern(entry.get("primaryAccession", ""))
     secondary_accessions = entry.get("secondaryAccessions", [])
-    uniprotkb_id = entry.get("uniProtkbId", "")
-    
-    # Extract organism information (scientific name, common name, taxonomy)
-    organism = entry.get("organism", {})
-    organism_scientific_name = organism.get("scientificName", "")
-    organism_common_name = organism.get("commonName", "")
-    organism_taxon_id = organism.get("taxonId", "")
-    organism_lineage = organism.get("lineage", [])
-    
-    # Extract organism hosts (viruses that infect this organism)
-    organism_hosts = entry.get("organismHosts", [])
-    hosts = []
-    for host in organism_hosts:
-        hosts.append({
-            "scientificName": host.get("scientificName", ""),
-            "commonName": host.get("commonName", ""),
-            "taxonId": host.get("taxonId", "")
-        })
+    uniprotkb_id = sys.intern(entry.get("uniProtkbId", ""))
+    
+    # Organism and host records are only built once a capsid feature is found
+    # (most entries have none), and are then shared by all hits of the entry
+    organism_record = None
+    hosts = None
     
     # Search through features to find capsid chains
-    features = entry.get("features", [])
+    # (the dict lookup and regex method are bound to locals for the loop)
+    get = dict.get
+    mentions_capsid = _re_capsid.search
+    is_capsid_description = _re_capsid_description.match
+    features = get(entry, "features") or ()
     for feature in features:
         # Only process "Chain" type features (not domains, regions, etc.)
-        if feature.get("type") != "Chain":
+        if get(feature, "type") != "Chain":
             continue
         
-        description = feature.get("description", "")
-        desc_lower = description.lower()
+        description = get(feature, "description", "")
+        
+        # Most chains (Gag polyprotein, matrix, spacer peptides...) do not mention
+        # capsid at all: reject those with a literal search first
+        if not mentions_capsid(description):
+            continue
         
         # Filter: must contain "capsid" but not "nucleocapsid" (we want capsid, not nucleocapsid)
-        if "capsid" in desc_lower and "nucleocapsid" not in desc_lower:
-            location = feature.get("location", {})
-            start_info = location.get("start", {})
-            end_info = location.get("end", {})
+        if is_capsid_description(description):
+            location = get(feature, "location") or _EMPTY
+            start_info = get(location, "start") or _EMPTY
+            end_info = get(location, "end") or _EMPTY
             
             # Only extract complete features (both start and end positions are EXACT)
             # This excludes partial or uncertain features
-            start_modifier = start_info.get("modifier", "")
-            end_modifier = end_info.get("modifier", "")
+            start_modifier = get(start_info, "modifier", "")
+            end_modifier = get(end_info, "modifier", "")
             
             if start_modifier == "EXACT" and end_modifier == "EXACT":
-                start_pos = int(start_info.get("value", 0))
-                end_pos = int(end_info.get("value", 0))
+                start_pos = int(get(start_info, "value", 0))
+                end_pos = int(get(end_info, "value", 0))
                 
                 # Skip if capsid extends to the end of the protein (likely incomplete annotation)
-                if full_sequence and end_pos == len(full_sequence):
+                if seq_len and end_pos == seq_len:
                     continue
                 
                 # Extract capsid sequence substring
                 # UniProt uses 1-based indexing (inclusive), Python uses 0-based (exclusive end)
                 # So convert: [start_pos, end_pos] -> [start_pos-1, end_pos)
-                capsid_sequence = full_sequence[start_pos - 1:end_pos] if full_sequence else ""
+                capsid_sequence = full_sequence[start_pos - 1:end_pos] if seq_len else ""
+                
+                if organism_record is None:
+                    # Extract organism information (scientific name, common name, taxonomy)
+                    organism = entry.get("organism", {})
+                    organism_record = {
+                        "scientificName": organism.get("scientificName", ""),
+                        "commonName": organism.get("commonName", ""),
+                        "taxonId": organism.get("taxonId", ""),
+                        "lineage": organism.get("lineage", [])
+                    }
+                    
+                    # Extract organism hosts (viruses that infect this organism)
+                    hosts = [
+                        {
+                            "scientificName": host.get("scientificName", ""),
+                            "commonName": host.get("commonName", ""),
+                            "taxonId": host.get("taxonId", "")
+                        }
+                        for host in entry.get("organismHosts", [])
+                    ]
                 
                 # Create hit record with all metadata
                 hit = {
                     "primaryAccession": primary_accession,
                     "secondaryAccessions": secondary_accessions,
                     "uniProtkbId": uniprotkb_id,
-                    "organism": {
-                        "scientificName": organism_scientific_name,
-                        "commonName": organism_common_name,
-                        "taxonId": organism_taxon_id,
-                        "lineage": organism_lineage
-                    },
+                    "organism": organism_record,
                     "organismHosts": hosts,
                     "sequence": capsid_sequence,  # Capsid sequence, not full protein
                     "description": description  # Description of the capsid feature